@@ -1,33 +1,154 @@
 import os
-os.environ["OMP_NUM_THREADS"] = "1"
-os.environ["OPENBLAS_NUM_THREADS"] = "1"
-os.environ["MKL_NUM_THREADS"] = "1"
-
-from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, jsonify
+import time
+import atexit
+import logging
+import threading
+_import_started = time.perf_counter()
+# One math thread per process; scale across cores with INFERENCE_BACKEND=process
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, jsonify, g, abort
 from flask_caching import Cache
 from flask_compress import Compress
 from flask_bcrypt import Bcrypt
-from face_emotion import EmotionDetector
-from database_setup import get_db_connection, init_db
+from flask_sock import Sock
+from client_stream import ClientFrameStream, decode_image
+from inference_pool import create_inference_pool
+from session_manager import SessionManager
+from log_writer import EmotionLogWriter
+from database_setup import db_connection, init_db, pool as db_pool
+from metrics import stage_snapshot, gauge, render_prometheus, HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+from face_emotion import EMOTIONS
 import pymysql
 from pymysql.cursors import DictCursor
-import matplotlib.pyplot as plt
-import io
 import base64
-import cv2
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.secret_key = "super_secret_key_12345"
 app.config['CACHE_TYPE'] = 'simple'
 app.config['COMPRESS_ALGORITHM'] = 'gzip'
+# Larger request bodies are answered with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_UPLOAD_BYTES", str(16 * 1024 * 1024)))
 
 cache = Cache(app)
 Compress(app)
 bcrypt = Bcrypt(app)
-detector = EmotionDetector()
+sock = Sock(app)
+
+@cache.memoize(timeout=300)
+def _emotion_distribution(user_id, session_id):
+    # Cached per (user, session); session_id None means all of the user's sessions
+    counts = dict.fromkeys(EMOTIONS, 0)
+    with db_connection() as conn:
+        if not conn:
+            return None
+        with conn.cursor(DictCursor) as cursor:
+            if session_id:
+                cursor.execute('''
+                    SELECT c.emotion, c.count
+                    FROM session_emotion_counts c
+                    JOIN sessions s ON s.id = c.session_id
+                    WHERE c.session_id = %s AND s.user_id = %s
+                ''', (session_id, user_id))
+            else:
+                cursor.execute(
+                    'SELECT emotion, count FROM user_emotion_counts WHERE user_id = %s',
+                    (user_id,)
+                )
+            for row in cursor.fetchall():
+                if row['emotion'] in counts:
+                    counts[row['emotion']] = row['count']
+    return {"emotions": list(counts), "counts": list(counts.values())}
+
+def _invalidate_emotion_distribution(user_id, session_id):
+    cache.delete_memoized(_emotion_distribution, user_id, None)
+    cache.delete_memoized(_emotion_distribution, user_id, session_id)
+
+def _camera_source(value):
+    # A camera index, or a stream URL / video file path
+    return int(value) if value.isdigit() else value
+
+inference_pool = create_inference_pool(
+    backend=os.environ.get("INFERENCE_BACKEND", "thread"),
+    face_detector=os.environ.get("FACE_DETECTOR", "haar"),
+    emotion_backend=os.environ.get("EMOTION_BACKEND", "fer"),
+    model_path=os.environ.get("EMOTION_MODEL_PATH") or None,
+    workers=int(os.environ.get("INFERENCE_WORKERS", "4")),
+)
+log_writer = EmotionLogWriter(
+    batch_size=int(os.environ.get("EMOTION_LOG_BATCH_SIZE", "500")),
+    flush_interval=float(os.environ.get("EMOTION_LOG_FLUSH_INTERVAL", "2.0")),
+)
+session_manager = SessionManager(
+    inference_pool,
+    process_workers=int(os.environ.get("SESSION_PROCESS_WORKERS", "1")),
+    detect_interval=int(os.environ.get("DETECT_INTERVAL", "1")),
+    log_writer=log_writer,
+    on_session_end=_invalidate_emotion_distribution,
+    camera_source=_camera_source(os.environ.get("CAMERA_SOURCE", "0")),
+    full_scan_interval=int(os.environ.get("FULL_SCAN_INTERVAL", "5")),
+    result_cache_threshold=float(os.environ.get("RESULT_CACHE_THRESHOLD", "0.03")),  # 0 classifies every face
+    result_cache_ttl=float(os.environ.get("RESULT_CACHE_TTL", "2.0")),
+)
+atexit.register(db_pool.close)  # atexit runs in reverse, so this closes after the sessions
+atexit.register(session_manager.shutdown)
+
+gauge('detection_sessions', 'Sessions with a running webcam loop', session_manager.active_count)
+gauge('frame_buffer_depth', 'Captured frames waiting for detection, across sessions', session_manager.buffered_frames)
+gauge('emotion_log_queue_depth', 'Emotion log events waiting to be written', log_writer.queue.qsize)
+gauge('db_pool_connections', 'Pooled database connections by state',
+      lambda: {state: db_pool.stats()[state] for state in ('in_use', 'idle')}, 'state')
+gauge('models_loaded', 'Whether the inference pool has its models loaded', lambda: int(inference_pool.ready()))
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    # Streamed responses (/video_feed) are timed until their headers go out
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+_db_ready = False
+_db_retry_at = 0.0
+_db_init_lock = threading.Lock()
+
+@app.before_request
+def _init_db_once():
+    # Schema setup waits for the first request instead of blocking startup; retried every few seconds until it succeeds
+    global _db_ready, _db_retry_at
+    if _db_ready or time.monotonic() < _db_retry_at:
+        return
+    with _db_init_lock:
+        if not _db_ready and time.monotonic() >= _db_retry_at:
+            _db_ready = init_db()
+            _db_retry_at = time.monotonic() + 5.0
+
+def _warm_up():
+    started = time.perf_counter()
+    try:
+        inference_pool.warm_up()
+        logger.info(f"Models warmed up in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {e}")
+
+if os.environ.get("WARM_UP_MODELS", "1") == "1":
+    threading.Thread(target=_warm_up, name="model-warm-up", daemon=True).start()
 
-init_db()
+@app.route("/ready")
+def ready():
+    status = {"models": inference_pool.ready(), "database": _db_ready}
+    return jsonify({"ready": all(status.values()), **status}), 200 if all(status.values()) else 503
 
 @app.route("/")
 def index():
@@ -39,19 +160,36 @@ def index():
 def video_feed():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    return Response(detector.generate_frames(), mimetype="multipart/x-mixed-replace; boundary=frame")
+    return Response(session_manager.get(session['user_id']).generate_frames(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 @app.route("/get_emotion_summary")
 def get_emotion_summary():
     if 'user_id' not in session:
         return jsonify({"success": False, "message": "Not logged in"}), 401
-    return jsonify(detector.emotion_summary)
+    return jsonify(session_manager.get(session['user_id']).emotion_summary)
+
+@app.route("/pipeline_stats")
+def pipeline_stats():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Not logged in"}), 401
+    return jsonify(stage_snapshot())
+
+@app.route("/metrics")
+def prometheus_metrics():
+    # Unauthenticated like /ready, so Prometheus can scrape it
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/db_pool_stats")
+def db_pool_stats():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Not logged in"}), 401
+    return jsonify(db_pool.stats())
 
 @app.route("/start_session", methods=["POST"])
 def start_session_endpoint():
     if 'user_id' not in session:
         return jsonify({"success": False, "message": "Not logged in"}), 401
-    if detector.start_session():
+    if session_manager.get(session['user_id']).start_session():
         return jsonify({"success": True})
     return jsonify({"success": False, "message": "Failed to start session"}), 500
 
@@ -59,97 +197,123 @@ def start_session_endpoint():
 def stop_session():
     if 'user_id' not in session:
         return jsonify({"success": False, "message": "Not logged in"}), 401
-    detector.stop_session()
+    session_manager.get(session['user_id']).stop_session()
     return jsonify({"success": True})
 
+_upload_buffers = threading.local()
+UPLOAD_BUFFER_KEEP = 1024 * 1024  # Largest buffer a worker thread keeps between uploads
+
+def _read_body_into_buffer(stream, length):
+    # Reuse one buffer per worker thread instead of allocating per upload; rare larger bodies get their own
+    buf = getattr(_upload_buffers, 'buf', None)
+    if buf is None or len(buf) < length:
+        buf = bytearray(max(length, 256 * 1024))
+        if len(buf) <= UPLOAD_BUFFER_KEEP:
+            _upload_buffers.buf = buf
+    view = memoryview(buf)
+    read = 0
+    while read < length:
+        n = stream.readinto(view[read:length])
+        if not n:
+            break
+        read += n
+    return np.frombuffer(buf, dtype=np.uint8, count=read)
+
+def _decode_upload(file_storage):
+    stream = file_storage.stream
+    data = stream.getbuffer() if hasattr(stream, 'getbuffer') else file_storage.read()
+    return decode_image(data)
+
+def _decode_request_frame():
+    if request.mimetype in ('image/jpeg', 'image/png', 'application/octet-stream'):
+        if request.content_length:
+            if request.content_length > app.config['MAX_CONTENT_LENGTH']:
+                abort(413)
+            np_arr = _read_body_into_buffer(request.stream, request.content_length)
+        else:
+            np_arr = np.frombuffer(request.get_data(), np.uint8)
+        return decode_image(np_arr)
+    if 'image' in request.files:
+        return _decode_upload(request.files['image'])
+
+    # Legacy JSON body with a base64 data URL
+    data = request.json["image"]
+    encoded_data = data.split(",")[1]
+    return decode_image(base64.b64decode(encoded_data))
+
 @app.route("/predict_emotion", methods=["POST"])
 def predict_emotion():
     if 'user_id' not in session:
         return jsonify({"success": False, "message": "Not logged in"}), 401
     
-    data = request.json["image"]
-    encoded_data = data.split(",")[1]
-    image_bytes = base64.b64decode(encoded_data)
-    np_arr = np.frombuffer(image_bytes, np.uint8)
-    frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    frame = _decode_request_frame()
+    if frame is None:
+        return jsonify({"success": False, "message": "Invalid image"}), 400
     
-    summary = detector.process_client_frame(frame)
+    summary = session_manager.get(session['user_id']).process_client_frame(frame)
     return jsonify(summary)
 
+@app.route("/predict_emotion_batch", methods=["POST"])
+def predict_emotion_batch():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Not logged in"}), 401
+
+    frames = [_decode_upload(f) for f in request.files.getlist('frames')]
+    if not frames or any(frame is None for frame in frames):
+        return jsonify({"success": False, "message": "Invalid image"}), 400
+
+    summaries = session_manager.get(session['user_id']).process_client_frames(frames)
+    return jsonify(summaries)
+
+@sock.route("/ws/stream")
+def stream_socket(ws):
+    if 'user_id' not in session:
+        ws.close(reason=1008, message="Not logged in")
+        return
+    ClientFrameStream(ws, session_manager.get(session['user_id'])).run()
+
 @app.route("/dashboard")
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    emotions = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-    counts = [0] * 7
     sessions = []
     selected_session = request.args.get('session_id', '')
     stats = {"total_sessions": 0, "total_faces_detected": 0, "most_common_emotion": "N/A"}
 
-    if conn:
-        try:
-            with conn.cursor(DictCursor) as cursor:
-                cursor.execute('SELECT id, start_time FROM sessions WHERE user_id = %s ORDER BY start_time DESC', (session['user_id'],))
-                sessions = cursor.fetchall()
-
-                query = '''
-                    SELECT emotion, COUNT(*) as count 
-                    FROM emotion_logs 
-                    WHERE session_id IN (SELECT id FROM sessions WHERE user_id = %s)
-                '''
-                params = [session['user_id']]
-                if selected_session:
-                    query += ' AND session_id = %s'
-                    params.append(selected_session)
-                query += ' GROUP BY emotion'
-                cursor.execute(query, params)
-                emotion_dist = cursor.fetchall()
-                for e in emotion_dist:
-                    if e['emotion'] in emotions:
-                        idx = emotions.index(e['emotion'])
-                        counts[idx] = e['count']
-
-                cursor.execute('SELECT * FROM dashboard_stats WHERE id = 1')
-                stats = cursor.fetchone() or stats
+    with db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor(DictCursor) as cursor:
+                    cursor.execute('SELECT id, start_time FROM sessions WHERE user_id = %s ORDER BY start_time DESC', (session['user_id'],))
+                    sessions = cursor.fetchall()
 
-        except pymysql.MySQLError as e:
-            flash(f"Database error: {e.args[1]}", "error")
-        finally:
-            conn.close()
-
-    plt.figure(figsize=(8, 5))
-    plt.bar(emotions, counts, color=['#FF6384', '#FF9F40', '#FFCD56', '#4BC0C0', '#36A2EB', '#9966FF', '#C9CBCF'], edgecolor='black')
-    plt.title(f'Emotion Distribution {"(Session #" + selected_session + ")" if selected_session else "(All Sessions)"}', fontsize=14, pad=10)
-    plt.xlabel('Emotions', fontsize=12)
-    plt.ylabel('Count', fontsize=12)
-    plt.ylim(0, max(counts, default=0) + 2)
-    plt.xticks(rotation=45, ha='right', fontsize=10)
-    plt.yticks(fontsize=10)
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.tight_layout()
-
-    bar_img = io.BytesIO()
-    plt.savefig(bar_img, format='png', bbox_inches='tight', dpi=100)
-    plt.close()
-    bar_img.seek(0)
-    bar_chart_data = base64.b64encode(bar_img.getvalue()).decode('utf-8')
-
-    if sum(counts) > 0:
-        plt.figure(figsize=(5, 5))
-        plt.pie(counts, labels=emotions, colors=['#FF6384', '#FF9F40', '#FFCD56', '#4BC0C0', '#36A2EB', '#9966FF', '#C9CBCF'], autopct='%1.1f%%', startangle=90, textprops={'fontsize': 10})
-        plt.title('Emotion Proportions', fontsize=14, pad=10)
-
-        pie_img = io.BytesIO()
-        plt.savefig(pie_img, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        pie_img.seek(0)
-        pie_chart_data = base64.b64encode(pie_img.getvalue()).decode('utf-8')
-    else:
-        pie_chart_data = None
-
-    return render_template("dashboard.html", bar_chart_data=bar_chart_data, pie_chart_data=pie_chart_data, sessions=sessions, selected_session=selected_session, stats=stats)
+                    cursor.execute('SELECT * FROM dashboard_stats WHERE id = 1')
+                    stats = cursor.fetchone() or stats
+
+            except pymysql.MySQLError as e:
+                flash(f"Database error: {e.args[1]}", "error")
+
+    # Charts are drawn in the browser from /api/emotion_distribution
+    return render_template("dashboard.html", sessions=sessions, selected_session=selected_session, stats=stats)
+
+@app.route("/api/emotion_distribution")
+def emotion_distribution():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Not logged in"}), 401
+
+    session_id = request.args.get('session_id', '')
+    if session_id and not session_id.isdigit():
+        return jsonify({"success": False, "message": "Invalid session"}), 400
+    session_id = int(session_id) if session_id else None
+
+    try:
+        distribution = _emotion_distribution(session['user_id'], session_id)
+    except pymysql.MySQLError as e:
+        return jsonify({"success": False, "message": f"Database error: {e.args[1]}"}), 500
+    if distribution is None:
+        return jsonify({"success": False, "message": "Database error"}), 500
+    return jsonify({"success": True, "session_id": session_id, **distribution})
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -157,31 +321,31 @@ def login():
         username = request.form.get("username")
         password = request.form.get("password")
 
-        conn = get_db_connection()
-        if not conn:
-            flash("Database unavailable", "error")
-            return redirect(url_for('login'))
+        with db_connection() as conn:
+            if not conn:
+                flash("Database unavailable", "error")
+                return redirect(url_for('login'))
 
-        try:
-            with conn.cursor(DictCursor) as cursor:
-                cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-                user = cursor.fetchone()
+            try:
+                with conn.cursor(DictCursor) as cursor:
+                    cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+                    user = cursor.fetchone()
                 
-                if user and bcrypt.check_password_hash(user['password'], password):
-                    session['user_id'] = user['id']
-                    session['username'] = user['username']
-                    return redirect(url_for('index'))
-                else:
-                    flash("Invalid credentials", "error")
-        except pymysql.MySQLError as e:
-            flash(f"Database error: {e.args[1]}", "error")
-        finally:
-            conn.close()
+                    if user and bcrypt.check_password_hash(user['password'], password):
+                        session['user_id'] = user['id']
+                        session['username'] = user['username']
+                        return redirect(url_for('index'))
+                    else:
+                        flash("Invalid credentials", "error")
+            except pymysql.MySQLError as e:
+                flash(f"Database error: {e.args[1]}", "error")
     
     return render_template("login.html")
 
 @app.route("/logout")
 def logout():
+    if 'user_id' in session:
+        session_manager.remove(session['user_id'])
     session.clear()
     return redirect(url_for('login'))
 
@@ -195,27 +359,25 @@ def signup():
             flash("Both fields are required", "error")
             return redirect(url_for('signup'))
 
-        conn = get_db_connection()
-        if not conn:
-            flash("Database unavailable", "error")
-            return redirect(url_for('signup'))
-
-        try:
-            hashed_pw = bcrypt.generate_password_hash(password).decode("utf-8")
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "INSERT INTO users (username, password) VALUES (%s, %s)",
-                    (username, hashed_pw)
-                )
-                conn.commit()
-                flash("Account created!", "success")
-                return redirect(url_for('login'))
-        except pymysql.IntegrityError:
-            flash("Username already exists", "error")
-        except pymysql.MySQLError as e:
-            flash(f"Database error: {e.args[1]}", "error")
-        finally:
-            conn.close()
+        with db_connection() as conn:
+            if not conn:
+                flash("Database unavailable", "error")
+                return redirect(url_for('signup'))
+
+            try:
+                hashed_pw = bcrypt.generate_password_hash(password).decode("utf-8")
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "INSERT INTO users (username, password) VALUES (%s, %s)",
+                        (username, hashed_pw)
+                    )
+                    conn.commit()
+                    flash("Account created!", "success")
+                    return redirect(url_for('login'))
+            except pymysql.IntegrityError:
+                flash("Username already exists", "error")
+            except pymysql.MySQLError as e:
+                flash(f"Database error: {e.args[1]}", "error")
     
     return render_template("signup.html")
 
@@ -224,57 +386,56 @@ def edit_account():
     if "user_id" not in session:
         return redirect(url_for("login"))
 
-    conn = get_db_connection()
-    if not conn:
-        flash("Database connection error", "error")
-        return redirect(url_for('index'))
-
-    try:
-        if request.method == "POST":
-            new_username = request.form["username"]
-            new_password = bcrypt.generate_password_hash(request.form["password"]).decode("utf-8")
-
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "UPDATE users SET username = %s, password = %s WHERE id = %s",
-                    (new_username, new_password, session["user_id"])
-                )
-                conn.commit()
-                session["username"] = new_username
-                flash("Account updated successfully!", "success")
-                return redirect(url_for("index"))
+    with db_connection() as conn:
+        if not conn:
+            flash("Database connection error", "error")
+            return redirect(url_for('index'))
 
-        return render_template("edit_account.html")
-    except pymysql.MySQLError as e:
-        flash(f"Database error: {e.args[1]}", "error")
-        return redirect(url_for('index'))
-    finally:
-        conn.close()
+        try:
+            if request.method == "POST":
+                new_username = request.form["username"]
+                new_password = bcrypt.generate_password_hash(request.form["password"]).decode("utf-8")
+
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "UPDATE users SET username = %s, password = %s WHERE id = %s",
+                        (new_username, new_password, session["user_id"])
+                    )
+                    conn.commit()
+                    session["username"] = new_username
+                    flash("Account updated successfully!", "success")
+                    return redirect(url_for("index"))
+
+            return render_template("edit_account.html")
+        except pymysql.MySQLError as e:
+            flash(f"Database error: {e.args[1]}", "error")
+            return redirect(url_for('index'))
 
 @app.route("/delete_account", methods=["POST"])
 def delete_account():
     if "user_id" not in session:
         return jsonify({"success": False, "message": "Not logged in"}), 401
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"success": False, "message": "Database error"}), 500
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"success": False, "message": "Database error"}), 500
 
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("DELETE FROM users WHERE id = %s", (session["user_id"],))
-            conn.commit()
-            session.clear()
-            flash("Account deleted successfully.", "success")
-            return jsonify({"success": True})
-    except pymysql.MySQLError as e:
-        return jsonify({"success": False, "message": f"Database error: {e.args[1]}"}), 500
-    finally:
-        conn.close()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM users WHERE id = %s", (session["user_id"],))
+                conn.commit()
+                session_manager.remove(session["user_id"])
+                session.clear()
+                flash("Account deleted successfully.", "success")
+                return jsonify({"success": True})
+        except pymysql.MySQLError as e:
+            return jsonify({"success": False, "message": f"Database error: {e.args[1]}"}), 500
 
 @app.route("/about_us")
 def about_us():
     return render_template("about_us.html")
 
+logger.info(f"App initialized in {(time.perf_counter() - _import_started) * 1000:.0f} ms")
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
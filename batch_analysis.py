@@ -0,0 +1,324 @@
+import os
+import csv
+import time
+import logging
+import argparse
+from collections import deque
+from datetime import datetime
+import cv2
+from face_emotion import EMOTIONS, FACE_DETECTORS
+from face_tracker import FaceTracker
+from session_stats import SessionStats
+from inference_pool import INFERENCE_BACKENDS, create_inference_pool
+from emotion_backends import EMOTION_BACKENDS
+from database_setup import db_connection
+from log_writer import EmotionLogWriter
+from model_export import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ['source', 'frame', 'time_s', 'track_id', 'emotion', 'confidence',
+                  'x', 'y', 'w', 'h'] + EMOTIONS
+
+
+def iter_frames(source, every=1, fps=None, max_frames=None):
+    """Yield (frame_index, time_s, frame) from a video file or an image directory.
+
+    Only sampled frames are decoded: every keeps one frame in every, fps keeps
+    at most that many frames per second of video. Images in a directory are
+    taken in name order and spaced one second apart, so fps applies to them too.
+    """
+    if every < 1 or (fps is not None and fps <= 0):
+        raise ValueError(f"every must be at least 1 and fps greater than 0, got every={every}, fps={fps}")
+    yielded = 0
+    if os.path.isdir(source):
+        step = max(every, int(round(1.0 / fps)) if fps else 1)
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names[::step]):
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is None:
+                logger.warning(f"Skipping unreadable image {name}")
+                continue
+            yield index * step, float(index * step), frame
+            yielded += 1
+            if max_frames and yielded >= max_frames:
+                return
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {source}")
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(every, int(round(video_fps / fps)) if fps else 1)
+    index = 0
+    try:
+        while True:
+            # grab() skips a frame without decoding it
+            if index % step:
+                if not cap.grab():
+                    return
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                yield index, index / video_fps, frame
+                yielded += 1
+                if max_frames and yielded >= max_frames:
+                    return
+            index += 1
+    finally:
+        cap.release()
+
+
+def analyze_source(source, pool, every=1, fps=None, max_frames=None, max_distance=50,
+                   frames_per_call=3, in_flight=None):
+    """Run detection and classification over one source on an inference pool.
+
+    Sampled frames go to the pool in groups of frames_per_call, several groups
+    ahead of the results being consumed, so decoding overlaps with inference.
+    Yields (frame_index, time_s, rows) per analyzed frame in order, with one row
+    per face: track_id and emotion come from a FaceTracker over the sampled
+    frames, the per-emotion columns are that frame's raw probabilities.
+    """
+    tracker = FaceTracker(EMOTIONS, max_distance=max_distance)
+    in_flight = in_flight or 2 * getattr(pool, 'workers', 4)
+    pending = deque()
+
+    def _frame_rows(frame_index, time_s, shape, boxes, results):
+        # Boxes come back in 640x480 display coordinates
+        sx, sy = shape[1] / 640.0, shape[0] / 480.0
+        visible = tracker.update(boxes, [probs for _, probs, _ in results])
+        by_box = {box: track_id for track_id, (_, _, box) in visible.items()}
+        rows = []
+        for box, (_, probs, _) in zip(boxes, results):
+            box = tuple(int(v) for v in box)
+            track_id = by_box.get(box)
+            row = {
+                'source': source,
+                'frame': frame_index,
+                'time_s': round(time_s, 3),
+                'track_id': track_id,
+                'emotion': visible[track_id][1] if track_id is not None else EMOTIONS[int(probs.argmax())],
+                'confidence': round(tracker.confidences.get(track_id, float(probs.max())), 4),
+                'x': int(box[0] * sx), 'y': int(box[1] * sy),
+                'w': int(box[2] * sx), 'h': int(box[3] * sy),
+            }
+            row.update((e, round(float(p), 4)) for e, p in zip(EMOTIONS, probs))
+            rows.append(row)
+        return rows
+
+    def _collect():
+        frames, future = pending.popleft()
+        for (frame_index, time_s, shape), (boxes, results) in zip(frames, future.result()):
+            yield frame_index, time_s, _frame_rows(frame_index, time_s, shape, boxes, results)
+
+    group = []
+    frames = []
+    for frame_index, time_s, frame in iter_frames(source, every, fps, max_frames):
+        # Whole frames go to the pool so faces are cropped at the video's own resolution
+        group.append((frame_index, time_s, frame.shape))
+        frames.append(frame)
+        if len(group) == frames_per_call:
+            pending.append((group, pool.submit(frames)))
+            group, frames = [], []
+            if len(pending) >= in_flight:
+                yield from _collect()
+    if group:
+        pending.append((group, pool.submit(frames)))
+    while pending:
+        yield from _collect()
+
+
+class CSVResultWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=RESULT_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetResultWriter:
+    """Buffers rows and writes them to a Parquet file one row group at a time (needs pyarrow)."""
+
+    def __init__(self, path, row_group_size=50000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        fields = [('source', pa.string()), ('frame', pa.int64()), ('time_s', pa.float64()),
+                  ('track_id', pa.int64()), ('emotion', pa.string()), ('confidence', pa.float32()),
+                  ('x', pa.int32()), ('y', pa.int32()), ('w', pa.int32()), ('h', pa.int32())]
+        self.schema = pa.schema(fields + [(e, pa.float32()) for e in EMOTIONS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def open_result_writer(path):
+    if path.lower().endswith('.parquet'):
+        return ParquetResultWriter(path)
+    return CSVResultWriter(path)
+
+
+class SessionRecorder:
+    """Stores one analyzed source as a session of user_id, with its faces in emotion_logs."""
+
+    def __init__(self, user_id, log_writer, started_at):
+        self.user_id = user_id
+        self.log_writer = log_writer
+        self.started_at = started_at
+        self.stats = SessionStats(EMOTIONS, max_gap=float('inf'))
+        self.session_id = None
+        with db_connection() as conn:
+            if not conn:
+                raise RuntimeError("Database unavailable")
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO sessions (user_id, start_time)
+                    VALUES (%s, FROM_UNIXTIME(%s))
+                ''', (user_id, started_at))
+                self.session_id = cursor.lastrowid
+                cursor.execute('UPDATE dashboard_stats SET total_sessions = total_sessions + 1 WHERE id = 1')
+                conn.commit()
+
+    def add(self, time_s, rows):
+        visible = {}
+        for row in rows:
+            if row['track_id'] is not None:
+                visible[row['track_id']] = (None, row['emotion'], None)
+                self.log_writer.log(self.session_id, row['track_id'], row['emotion'], row['confidence'],
+                                    self.started_at + time_s)
+        self.stats.update(visible, time_s)
+
+    def finish(self, duration_s):
+        self.log_writer.flush()
+        with db_connection() as conn:
+            if not conn:
+                logger.error(f"Could not finish session {self.session_id}: database unavailable")
+                return
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    UPDATE sessions SET
+                        end_time = FROM_UNIXTIME(%s),
+                        total_faces = %s,
+                        most_common_emotion = %s
+                    WHERE id = %s
+                ''', (self.started_at + duration_s, self.stats.unique_faces,
+                      self.stats.most_common_emotion(), self.session_id))
+                cursor.execute('''
+                    UPDATE dashboard_stats SET
+                        total_faces_detected = total_faces_detected + %s,
+                        last_updated = NOW()
+                    WHERE id = 1
+                ''', (self.stats.unique_faces,))
+                conn.commit()
+
+
+def run_batch(sources, outputs=(), pool=None, every=1, fps=None, max_frames=None, max_distance=50,
+              user_id=None, recorded_at=None):
+    """Analyze every source and stream the rows to the result files and, with a user_id, to the database.
+
+    Returns per-source stats (frames, faces, seconds of video, processing seconds).
+    """
+    writers = []
+    log_writer = EmotionLogWriter() if user_id is not None else None
+    summary = []
+    try:
+        for path in outputs:
+            writers.append(open_result_writer(path))
+        for source in sources:
+            started = time.perf_counter()
+            recorder = None
+            if log_writer:
+                recorder = SessionRecorder(user_id, log_writer, recorded_at or time.time())
+            frames = faces = 0
+            last_time = 0.0
+            for _, time_s, rows in analyze_source(source, pool, every, fps, max_frames, max_distance):
+                for row in rows:
+                    for writer in writers:
+                        writer.write(row)
+                if recorder:
+                    recorder.add(time_s, rows)
+                frames += 1
+                faces += len(rows)
+                last_time = time_s
+            elapsed = time.perf_counter() - started
+            if recorder:
+                recorder.finish(last_time)
+            speed = last_time / elapsed if elapsed > 0 else 0.0
+            logger.info(f"{source}: {frames} frames, {faces} faces, "
+                        f"{last_time:.1f}s of video in {elapsed:.1f}s ({speed:.1f}x real-time)")
+            summary.append({"source": source, "frames": frames, "faces": faces,
+                            "video_s": last_time, "elapsed_s": elapsed,
+                            "session_id": recorder.session_id if recorder else None})
+    finally:
+        for writer in writers:
+            writer.close()
+        if log_writer:
+            log_writer.close()
+    return summary
+
+
+def _positive(kind):
+    def parse(value):
+        number = kind(value)
+        if number <= 0:
+            raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+        return number
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze recorded videos or image directories offline")
+    parser.add_argument("sources", nargs="+", help="Video files or image directories")
+    parser.add_argument("--output", action="append", default=[],
+                        help="Result file, .csv or .parquet (may be given more than once)")
+    parser.add_argument("--every", type=_positive(int), default=1, help="Analyze one frame in every N")
+    parser.add_argument("--fps", type=_positive(float), help="Analyze at most this many frames per second of video (images are one second apart)")
+    parser.add_argument("--max-frames", type=_positive(int), help="Stop each source after this many analyzed frames")
+    parser.add_argument("--track-distance", type=float, default=50,
+                        help="Max centroid movement (display pixels) between analyzed frames for one face")
+    parser.add_argument("--backend", choices=INFERENCE_BACKENDS, default="process")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--face-detector", choices=FACE_DETECTORS, default="haar")
+    parser.add_argument("--emotion-backend", choices=EMOTION_BACKENDS, default="fer")
+    parser.add_argument("--model-path", help="Model file for the onnx / tflite emotion backends")
+    parser.add_argument("--user-id", type=int, help="Also store each source as a session of this user in emotion_logs")
+    parser.add_argument("--recorded-at", help="Recording start time (YYYY-MM-DD HH:MM:SS) used for the logged timestamps")
+    args = parser.parse_args()
+
+    if not args.output and args.user_id is None:
+        parser.error("nothing to write: give --output and/or --user-id")
+    recorded_at = datetime.strptime(args.recorded_at, "%Y-%m-%d %H:%M:%S").timestamp() if args.recorded_at else None
+
+    pool = create_inference_pool(backend=args.backend, face_detector=args.face_detector,
+                                 workers=args.workers, emotion_backend=args.emotion_backend,
+                                 model_path=args.model_path)
+    try:
+        pool.warm_up()  # Keep model loading out of the per-source timings
+        run_batch(args.sources, args.output, pool, args.every, args.fps, args.max_frames,
+                  args.track_distance, args.user_id, recorded_at)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
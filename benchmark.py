@@ -0,0 +1,1118 @@
+import os
+import argparse
+import json
+import time
+import socket
+import asyncio
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import http.client
+import multiprocessing
+from datetime import datetime
+from urllib.parse import urlencode
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from face_emotion import DetectionSession, EmotionDetector, EMOTIONS, FACE_DETECTORS, FACE_INPUT_SIZE
+from face_tracker import FaceTracker
+from emotion_backends import EMOTION_BACKENDS, create_emotion_backend
+from inference_pool import INFERENCE_BACKENDS
+from model_export import load_face_batch
+from benchmark_support import fixture_videos
+
+DEFAULT_FIXTURE_DIR = os.path.join(tempfile.gettempdir(), "emotion_benchmark_fixtures")
+
+
+def _percentile(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else 0.0
+
+
+def _stage_report(timings):
+    return {
+        stage: {
+            "mean_ms": float(np.mean(samples)) * 1000 if samples else 0.0,
+            "p50_ms": _percentile(samples, 50),
+            "p99_ms": _percentile(samples, 99),
+        }
+        for stage, samples in timings.items()
+    }
+
+
+def benchmark_detector(video_path, face_detector, max_frames=300):
+    """Run the capture -> detect -> classify path of one detector over a video file."""
+    detector = EmotionDetector(face_detector=face_detector)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+
+    timings = {"decode": [], "detect": [], "classify": []}
+    frames = faces_total = 0
+    started = time.perf_counter()
+    try:
+        while frames < max_frames:
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            t1 = time.perf_counter()
+            boxes = detector.locate_faces(frame)
+            t2 = time.perf_counter()
+            detector.analyze_faces([frame], [boxes])
+            t3 = time.perf_counter()
+
+            timings["decode"].append(t1 - t0)
+            timings["detect"].append(t2 - t1)
+            timings["classify"].append(t3 - t2)
+            frames += 1
+            faces_total += len(boxes)
+    finally:
+        cap.release()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "detector": face_detector,
+        "frames": frames,
+        "faces": faces_total,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "stages": _stage_report(timings),
+    }
+
+
+def _print_detector_report(report):
+    print(f"[{report['detector']}] {report['frames']} frames, {report['faces']} faces, "
+          f"{report['fps']:.1f} fps")
+    _print_stages(report["stages"])
+
+
+def _print_stages(stages, indent="  "):
+    for stage, stats in stages.items():
+        print(f"{indent}{stage:<10} mean {stats['mean_ms']:7.2f} ms  "
+              f"p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms")
+
+
+def _synthetic_scene(num_faces, num_frames, seed=0, size=(640, 480), miss_rate=0.02):
+    """Yield per frame a shuffled list of (face_index, box) for faces drifting with jitter."""
+    rng = np.random.default_rng(seed)
+    side = int(np.clip(np.sqrt(size[0] * size[1] / max(num_faces, 1)) * 0.5, 20, 120))
+    limit = np.array([size[0] - side, size[1] - side], dtype=float)
+    positions = rng.uniform([0, 0], limit, (num_faces, 2))
+    velocities = rng.uniform(-3, 3, (num_faces, 2))
+    for _ in range(num_frames):
+        positions = positions + velocities + rng.normal(0, 1, positions.shape)
+        # Bounce off the borders so faces do not pile up there
+        outside = (positions < 0) | (positions > limit)
+        velocities[outside] *= -1
+        positions = np.clip(positions, 0, limit)
+        seen = [(i, (int(x), int(y), side, side)) for i, (x, y) in enumerate(positions)
+                if rng.random() >= miss_rate]
+        rng.shuffle(seen)
+        yield seen
+
+
+def _legacy_track(face_tracker, boxes, threshold=50):
+    # The nested-loop centroid matcher the sessions used before FaceTracker
+    new_tracker = {}
+    for (x, y, w, h) in boxes:
+        centroid = (x + w//2, y + h//2)
+        closest_id = None
+        min_dist = float('inf')
+        for fid, (old_cent, _, _) in face_tracker.items():
+            dist = ((centroid[0]-old_cent[0])**2 + (centroid[1]-old_cent[1])**2)**0.5
+            if dist < min_dist and dist < threshold:
+                min_dist = dist
+                closest_id = fid
+        fid = closest_id if closest_id else len(face_tracker)
+        new_tracker[fid] = (centroid, 'neutral', (x, y, w, h))
+    return new_tracker
+
+
+def benchmark_tracker(face_counts, num_frames=100):
+    """Time FaceTracker against the legacy matcher on synthetic scenes.
+
+    id_switches counts faces whose ID changed between frames; id_collisions
+    counts faces that shared their ID with another face in the same frame.
+    """
+    # Match once up front so the lazy scipy import is not timed
+    primer = FaceTracker(EMOTIONS)
+    for _ in range(2):
+        primer.update([(0, 0, 40, 40)], [None])
+
+    reports = []
+    for num_faces in face_counts:
+        for name in ("face_tracker", "legacy"):
+            tracker = FaceTracker(EMOTIONS)
+            legacy_state = {}
+            last_id = {}
+            durations = []
+            switches = 0
+            collisions = 0
+            for seen in _synthetic_scene(num_faces, num_frames):
+                boxes = [box for _, box in seen]
+                started = time.perf_counter()
+                if name == "face_tracker":
+                    visible = tracker.update(boxes, [None] * len(boxes))
+                else:
+                    visible = legacy_state = _legacy_track(legacy_state, boxes)
+                durations.append(time.perf_counter() - started)
+                collisions += len(boxes) - len(visible)
+
+                id_for_box = {box: fid for fid, (_, _, box) in visible.items()}
+                for face_index, box in seen:
+                    fid = id_for_box.get(box)
+                    if face_index in last_id and fid != last_id[face_index]:
+                        switches += 1
+                    last_id[face_index] = fid
+            reports.append({
+                "tracker": name,
+                "faces": num_faces,
+                "frames": num_frames,
+                "id_switches": switches,
+                "id_collisions": collisions,
+                "update": _stage_report({"update": durations})["update"],
+            })
+    return reports
+
+
+def _print_tracker_report(report):
+    stats = report["update"]
+    print(f"[{report['tracker']:<12}] {report['faces']:4d} faces  "
+          f"mean {stats['mean_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms  "
+          f"id switches {report['id_switches']:5d}  id collisions {report['id_collisions']}")
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_isolated(func, *args):
+    # A fresh spawned process per measurement keeps loaded models and peak memory apart
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(func, *args).result()
+
+
+def _measure_backend(name, model_path, batch, batch_sizes, repeats):
+    # Runs in a fresh process so load time and memory belong to this backend alone
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    backend = create_emotion_backend(name, model_path).load()
+    load_s = time.perf_counter() - started
+    probs = backend.classify(batch)
+    rss_after = _rss_mb()
+
+    throughput = {}
+    for size in batch_sizes:
+        chunk = np.resize(batch, (size,) + batch.shape[1:])
+        durations = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            backend.classify(chunk)
+            durations.append(time.perf_counter() - t0)
+        median = float(np.median(durations))
+        throughput[size] = {
+            "faces_per_s": size / median if median > 0 else 0.0,
+            "p50_ms": _percentile(durations, 50),
+            "p99_ms": _percentile(durations, 99),
+        }
+    return {
+        "backend": name,
+        "model": getattr(backend, "model_path", None),
+        "load_s": load_s,
+        "rss_mb": rss_after,
+        "rss_increase_mb": rss_after - rss_before,
+        "throughput": throughput,
+        "probs": probs,
+    }
+
+
+def benchmark_backends(source, backends, model_paths=None, max_faces=500, batch_sizes=(1, 8, 32), repeats=50):
+    """Compare emotion backends on real face crops: agreement with fer, speed and memory.
+
+    Each backend is loaded in its own spawned process. Agreement is the share of
+    faces whose top emotion matches the fer backend's.
+    """
+    model_paths = model_paths or {}
+    batch = load_face_batch(source, max_faces)
+    if len(batch) == 0:
+        raise ValueError(f"No faces found in {source}")
+
+    reports = [_run_isolated(_measure_backend, name, model_paths.get(name), batch, list(batch_sizes), repeats)
+               for name in backends]
+
+    reference = next((r["probs"] for r in reports if r["backend"] == "fer"), None)
+    for report in reports:
+        probs = report.pop("probs")
+        report["faces"] = len(batch)
+        if reference is not None:
+            report["agreement"] = float(np.mean(np.argmax(probs, axis=1) == np.argmax(reference, axis=1)))
+            report["mean_abs_diff"] = float(np.mean(np.abs(probs - reference)))
+            report["max_abs_diff"] = float(np.max(np.abs(probs - reference)))
+    return reports
+
+
+def _print_backend_report(report):
+    line = (f"[{report['backend']:<6}] load {report['load_s']:6.2f} s  "
+            f"rss {report['rss_mb']:7.1f} MB (+{report['rss_increase_mb']:.1f})")
+    if "agreement" in report:
+        line += (f"  agreement {report['agreement'] * 100:5.1f}%  "
+                 f"mean |diff| {report['mean_abs_diff']:.4f}  max |diff| {report['max_abs_diff']:.4f}")
+    print(line)
+    for size, stats in report["throughput"].items():
+        print(f"  batch {size:<4} {stats['faces_per_s']:9.1f} faces/s  "
+              f"p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms")
+
+
+def _pipeline_stages():
+    from metrics import stage_snapshot
+    return {stage: {key: stats[key] for key in ("count", "mean_ms", "p50_ms", "p99_ms")}
+            for stage, stats in stage_snapshot().items() if stats["count"]}
+
+
+def _client_frames(video, count):
+    # Browsers send frames already scaled down to the detector size
+    from batch_analysis import iter_frames
+    return [cv2.resize(frame, (320, 240)) for _, _, frame in iter_frames(video, max_frames=count)]
+
+
+def _video_resolution(video):
+    cap = cv2.VideoCapture(video)
+    try:
+        return f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}"
+    finally:
+        cap.release()
+
+
+def _create_pool(options):
+    from inference_pool import create_inference_pool
+    return create_inference_pool(backend=options["backend"], face_detector=options["face_detector"],
+                                 workers=options["workers"], emotion_backend=options["emotion_backend"],
+                                 model_path=options["model_path"])
+
+
+def _measure_pipeline(name, video, options):
+    # Runs in a fresh process: one DetectionSession fed from a looping video file instead of the webcam
+    from benchmark_support import install_fake_database, ResourceMonitor
+    database = install_fake_database(options["db_latency_ms"] / 1000)
+    from face_emotion import DetectionSession
+    from log_writer import EmotionLogWriter
+    from metrics import reset_stages
+
+    pool = _create_pool(options)
+    log_writer = EmotionLogWriter()
+    try:
+        pool.warm_up()
+        session = DetectionSession(pool, user_id=1, detect_interval=options["detect_interval"],
+                                   log_writer=log_writer, camera_source=video,
+                                   full_scan_interval=options["full_scan_interval"],
+                                   result_cache_threshold=options["result_cache_threshold"],
+                                   result_cache_ttl=options["result_cache_ttl"])
+        received = [0] * options["viewers"]
+
+        def _watch(index):
+            for _ in session.generate_frames():
+                received[index] += 1
+
+        reset_stages()
+        monitor = ResourceMonitor().start()
+        if not session.start_session():
+            raise IOError(f"Cannot start a session on {video}")
+        viewers = [threading.Thread(target=_watch, args=(i,), daemon=True) for i in range(options["viewers"])]
+        for viewer in viewers:
+            viewer.start()
+        time.sleep(options["duration"])
+        usage = monitor.stop()
+        wall = usage["wall_s"]
+        stream = {
+            "fps": session.frame_counter / wall,
+            "captured_fps": session.frame_buffer.sequence / wall,
+            "published_fps": session.broadcaster.sequence / wall,
+            "viewer_fps": float(np.mean(received)) / wall if received else 0.0,
+            "dropped_frames": session.frame_buffer.dropped,
+            "unique_faces": session.stats.unique_faces,
+            "pool_frames": session.frame_pool.allocated,
+            "stages": _pipeline_stages(),
+            **usage,
+        }
+        session.stop_session()
+        for viewer in viewers:
+            viewer.join(timeout=5)
+
+        # The browser upload path: process_client_frame on pre-scaled frames, one at a time
+        frames = _client_frames(video, options["client_frames"])
+        reset_stages()
+        durations = []
+        for frame in frames:
+            started = time.perf_counter()
+            session.process_client_frame(frame)
+            durations.append(time.perf_counter() - started)
+        client = {
+            "frames": len(durations),
+            "fps": len(durations) / sum(durations) if durations else 0.0,
+            "latency": _stage_report({"frame": durations})["frame"],
+            "stages": _pipeline_stages(),
+        }
+    finally:
+        log_writer.close()
+        pool.shutdown()
+    return {
+        "name": f"pipeline/{name}",
+        "video": video,
+        "resolution": _video_resolution(video),
+        "stream": stream,
+        "client_frames": client,
+        "database": database.stats(),
+    }
+
+
+def benchmark_pipeline(videos, options):
+    """Measure the webcam and browser-upload paths of a detection session on each (name, video)."""
+    return [_run_isolated(_measure_pipeline, name, video, options) for name, video in videos]
+
+
+def _print_pipeline_report(report):
+    stream, client = report["stream"], report["client_frames"]
+    print(f"[{report['name']}] {report['resolution']}  {stream['fps']:.1f} fps processed "
+          f"({stream['captured_fps']:.1f} captured, {stream['dropped_frames']} dropped), "
+          f"{stream['viewer_fps']:.1f} fps per viewer  cpu {stream['cpu_percent']:.0f}%  "
+          f"peak rss {stream['peak_rss_mb']:.0f} MB (+{stream['workers_peak_rss_mb']:.0f} MB workers)")
+    _print_stages(stream["stages"], "  stream   ")
+    latency = client["latency"]
+    print(f"  client frames {client['fps']:.1f} fps  p50 {latency['p50_ms']:.2f} ms  p99 {latency['p99_ms']:.2f} ms")
+
+
+def _traced(func, *args):
+    # Peak bytes newly allocated while func runs
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    result = func(*args)
+    return result, tracemalloc.get_traced_memory()[1] - before
+
+
+def _allocation_pass(detector, video_path, reuse, max_frames, warmup):
+    session = DetectionSession(None, user_id=0)
+    session.broadcaster.open()
+    viewer = session.broadcaster.subscribe()
+    faces = np.empty((16,) + FACE_INPUT_SIZE + (3,), dtype=np.uint8)
+    batch = np.empty((16,) + FACE_INPUT_SIZE, dtype=np.float32)
+    gray = np.empty((16 * FACE_INPUT_SIZE[0], FACE_INPUT_SIZE[1]), dtype=np.uint8)
+    samples = {stage: [] for stage in ("capture", "detect", "crop", "preprocess", "classify", "annotate", "encode")}
+    shape = (480, 640, 3)
+
+    def _capture():
+        if not reuse:
+            return cap.read()
+        buffer = session.frame_pool.acquire(shape)
+        ret, frame = cap.read(buffer)
+        if frame is not buffer:
+            session.frame_pool.release(buffer)
+        return ret, frame
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+    tracemalloc.start()
+    try:
+        for index in range(warmup + max_frames):
+            (ret, frame), captured = _traced(_capture)
+            if not ret:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Loop short videos
+                (ret, frame), captured = _traced(_capture)
+                if not ret:
+                    break
+            shape = frame.shape
+            boxes, detected = _traced(detector.locate_faces, frame)
+            boxes = boxes[:len(faces)]
+            if reuse:
+                crops, cropped = _traced(detector.crop_faces, frame, boxes, faces[:len(boxes)])
+                inputs, preprocessed = _traced(detector.preprocess_faces, crops, batch[:len(boxes)],
+                                               gray[:len(boxes) * FACE_INPUT_SIZE[0]])
+            else:
+                crops, cropped = _traced(detector.crop_faces, frame, boxes)
+                inputs, preprocessed = _traced(detector.preprocess_faces, crops)
+            _, classified = _traced(detector.backend.classify, inputs) if len(boxes) else (None, 0)
+            tracker = {i: (None, "neutral", tuple(int(v) for v in box)) for i, box in enumerate(boxes)}
+            frame, annotated = _traced(session._annotate, frame, tracker)
+            session.broadcaster.publish(frame)
+            _, encoded = _traced(next, viewer)
+            # Held through the next encode: the viewer lets go of this frame there, and freeing it would hide the encode
+            keep_alive = frame
+            if index >= warmup:
+                for stage, size in zip(samples, (captured, detected, cropped, preprocessed, classified,
+                                                 annotated, encoded)):
+                    samples[stage].append(size)
+    finally:
+        tracemalloc.stop()
+        cap.release()
+        session.broadcaster.close()
+    return samples, session.frame_pool.allocated
+
+
+def benchmark_allocations(video_path, face_detector="haar", emotion_backend="fer", model_path=None,
+                          max_frames=200, warmup=20):
+    """Bytes allocated per frame by each stage of the capture -> detect -> classify -> annotate -> encode path.
+
+    Runs once with reused buffers (a frame pool and out= arrays, as sessions
+    do) and once with fresh arrays per frame. tracemalloc sees NumPy and
+    OpenCV arrays as well as Python objects; the classify stage is the model
+    runtime itself. The first warmup frames are not counted, so buffers
+    sized on first use and model set-up stay out of the steady state.
+    """
+    detector = EmotionDetector(face_detector=face_detector, emotion_backend=emotion_backend,
+                               model_path=model_path).load()
+    reports = []
+    for reuse in (True, False):
+        samples, pool_frames = _allocation_pass(detector, video_path, reuse, max_frames, warmup)
+        stages = {stage: {"mean_kb": float(np.mean(sizes)) / 1024 if sizes else 0.0,
+                          "max_kb": float(np.max(sizes)) / 1024 if sizes else 0.0}
+                  for stage, sizes in samples.items()}
+        reports.append({
+            "name": f"allocations/{'reused' if reuse else 'fresh'}",
+            "video": video_path,
+            "frames": len(samples["capture"]),
+            "pool_frames": pool_frames if reuse else 0,
+            "kb_per_frame": sum(stats["mean_kb"] for stats in stages.values()),
+            "kb_per_frame_without_model": sum(stats["mean_kb"] for stage, stats in stages.items()
+                                              if stage != "classify"),
+            "stages": stages,
+        })
+    return reports
+
+
+def _print_allocation_report(report):
+    print(f"[{report['name']}] {report['frames']} frames  {report['kb_per_frame']:.1f} KB allocated per frame "
+          f"({report['kb_per_frame_without_model']:.1f} KB outside the model), "
+          f"{report['pool_frames']} pooled frames")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage:<10} mean {stats['mean_kb']:9.1f} KB  max {stats['max_kb']:9.1f} KB")
+
+
+def benchmark_cache(source, thresholds, face_detector="haar", emotion_backend="fer", model_path=None,
+                    max_frames=None, ttl=2.0):
+    """Replay a recording through the face result cache at each threshold and compare with classifying every face.
+
+    Every frame is scanned whole once and its faces classified without the
+    cache; each threshold then runs its own cache and tracker over the same
+    boxes, with the video's timestamps as clock. agreement is the share of
+    faces whose top emotion matches the uncached one.
+    """
+    from batch_analysis import iter_frames
+    from result_cache import FaceResultCache
+    detector = EmotionDetector(face_detector=face_detector, emotion_backend=emotion_backend, model_path=model_path)
+    detector.load()
+    runs = [{"threshold": threshold, "cache": FaceResultCache(threshold, ttl), "tracker": FaceTracker(EMOTIONS),
+             "durations": [], "matches": 0, "diffs": []} for threshold in thresholds]
+    uncached = []
+    faces = frames = 0
+    for _, time_s, frame in iter_frames(source, max_frames=max_frames):
+        boxes = detector.locate_faces(frame)
+        started = time.perf_counter()
+        expected = [probs for _, probs, _ in detector.analyze_faces([frame], [boxes])[0]]
+        uncached.append(time.perf_counter() - started)
+        for run in runs:
+            started = time.perf_counter()
+            results = detector.analyze_faces([frame], [boxes], run["cache"].reference(time_s))[0]
+            run["durations"].append(time.perf_counter() - started)
+            visible = run["tracker"].update(boxes, [probs for _, probs, _ in results])
+            by_box = {box: track_id for track_id, (_, _, box) in visible.items()}
+            classified = {}
+            for box, (_, probs, signature), reference in zip(boxes, results, expected):
+                run["matches"] += int(np.argmax(probs) == np.argmax(reference))
+                run["diffs"].append(float(np.mean(np.abs(probs - reference))))
+                track_id = by_box.get(tuple(int(v) for v in box))
+                if track_id is not None:
+                    classified[track_id] = (box, probs, signature)
+            run["cache"].update(classified, time_s)
+        faces += len(boxes)
+        frames += 1
+    if not faces:
+        raise ValueError(f"No faces found in {source}")
+
+    baseline_ms = float(np.mean(uncached)) * 1000
+    reports = []
+    for run in runs:
+        classify_ms = float(np.mean(run["durations"])) * 1000
+        reports.append({
+            "name": f"{os.path.splitext(os.path.basename(source.rstrip(os.sep)))[0]}_t{run['threshold']:g}",
+            "threshold": run["threshold"],
+            "frames": frames,
+            "faces": faces,
+            "hit_rate": run["cache"].hit_rate(),
+            "agreement": run["matches"] / faces,
+            "mean_abs_diff": float(np.mean(run["diffs"])),
+            "classify_ms": classify_ms,
+            "uncached_classify_ms": baseline_ms,
+        })
+    return reports
+
+
+def _print_cache_report(report):
+    print(f"[{report['name']}] threshold {report['threshold']:<6g} hit rate {report['hit_rate'] * 100:5.1f}%  "
+          f"agreement {report['agreement'] * 100:5.1f}%  mean |diff| {report['mean_abs_diff']:.4f}  "
+          f"classify {report['classify_ms']:6.2f} ms/frame (uncached {report['uncached_classify_ms']:.2f} ms)")
+
+
+def _login(port, username, password):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("POST", "/login", urlencode({"username": username, "password": password}),
+                 {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader("Set-Cookie")
+    if response.status != 302 or not cookie:
+        raise RuntimeError(f"Login failed for {username}: HTTP {response.status}")
+    return conn, cookie.split(";", 1)[0]
+
+
+def _get_repeatedly(conn, cookie, path, deadline, latencies, statuses):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        conn.request("GET", path, headers={"Cookie": cookie})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status)
+
+
+def _post_frames(conn, cookie, jpegs, offset, deadline, latencies, statuses):
+    index = offset
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        conn.request("POST", "/predict_emotion", jpegs[index % len(jpegs)],
+                     {"Content-Type": "image/jpeg", "Cookie": cookie})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status)
+        index += 1
+
+
+def _watch_feed(port, cookie, deadline, arrivals, timeout):
+    boundary = b"--frame\r\n"
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", "/video_feed", headers={"Cookie": cookie})
+        response = conn.getresponse()
+        tail = b""
+        while time.perf_counter() < deadline:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            # A boundary may straddle two reads, so keep the end of the previous one
+            data = tail + chunk
+            arrivals.extend([time.perf_counter()] * data.count(boundary))
+            tail = data[-(len(boundary) - 1):]
+    finally:
+        conn.close()
+
+
+async def _hold_streams(port, cookie, count, deadline, frames, first_frames):
+    # Many /video_feed viewers on one event loop, so the load generator needs no thread per stream
+    boundary = b"--frame\r\n"
+
+    async def _watch(index):
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            return
+        try:
+            writer.write(f"GET /video_feed HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n\r\n".encode())
+            tail = b""
+            while time.perf_counter() < deadline:
+                try:
+                    chunk = await asyncio.wait_for(reader.read(65536), deadline - time.perf_counter())
+                except asyncio.TimeoutError:
+                    break
+                if not chunk:
+                    break
+                data = tail + chunk
+                found = data.count(boundary)
+                if found and not frames[index]:
+                    first_frames[index] = time.perf_counter()
+                frames[index] += found
+                tail = data[-(len(boundary) - 1):]
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(_watch(i) for i in range(count)))
+
+
+def _start_server(webapp, options):
+    # Returns the port and a function stopping the server
+    if options["server"] == "asgi":
+        import uvicorn
+        import serve
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        server = uvicorn.Server(uvicorn.Config(serve.create_app(options["threads"], options["stream_threads"]),
+                                               backlog=4096, timeout_keep_alive=300, log_level="warning",
+                                               access_log=False))
+        thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+        thread.start()
+        while not server.started and thread.is_alive():
+            time.sleep(0.05)
+
+        def _stop():
+            server.should_exit = True
+            thread.join(timeout=10)
+        return sock.getsockname()[1], _stop
+
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def _request_report(latencies, statuses, wall):
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status != 200),
+        "requests_per_s": len(latencies) / wall,
+        "latency": _stage_report({"request": latencies})["request"],
+    }
+
+
+def _measure_http(name, video, options):
+    # Runs in a fresh process: the Flask app on a local threaded server, its database faked
+    import logging
+    from benchmark_support import install_fake_database, ResourceMonitor
+    database = install_fake_database(options["db_latency_ms"] / 1000)
+    os.environ.update({
+        "INFERENCE_BACKEND": options["backend"],
+        "INFERENCE_WORKERS": str(options["workers"]),
+        "FACE_DETECTOR": options["face_detector"],
+        "EMOTION_BACKEND": options["emotion_backend"],
+        "EMOTION_MODEL_PATH": options["model_path"] or "",
+        "DETECT_INTERVAL": str(options["detect_interval"]),
+        "FULL_SCAN_INTERVAL": str(options["full_scan_interval"]),
+        "RESULT_CACHE_THRESHOLD": str(options["result_cache_threshold"]),
+        "RESULT_CACHE_TTL": str(options["result_cache_ttl"]),
+        "CAMERA_SOURCE": video,
+        "WARM_UP_MODELS": "0",
+    })
+    import app as webapp
+    from metrics import reset_stages
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # No per-request access log
+
+    webapp.inference_pool.warm_up()
+    port, stop_server = _start_server(webapp, options)
+    duration = options["duration"]
+    try:
+        password = "benchmark"
+        password_hash = webapp.bcrypt.generate_password_hash(password).decode("utf-8")
+        clients = []
+        for i in range(max(options["clients"], 1)):
+            database.add_user(f"bench{i}", password_hash)
+            clients.append(_login(port, f"bench{i}", password))
+        jpegs = [cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])[1].tobytes()
+                 for frame in _client_frames(video, 30)]
+
+        # /predict_emotion: every client is its own user posting frames back to back
+        latencies = [[] for _ in clients]
+        statuses = [[] for _ in clients]
+        reset_stages()
+        monitor = ResourceMonitor().start()
+        deadline = time.perf_counter() + duration
+        threads = [threading.Thread(target=_post_frames,
+                                    args=(conn, cookie, jpegs, i * 7, deadline, latencies[i], statuses[i]))
+                   for i, (conn, cookie) in enumerate(clients[:options["clients"]])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        usage = monitor.stop()
+        all_latencies = [v for client in latencies for v in client]
+        all_statuses = [v for client in statuses for v in client]
+        predict = {
+            "clients": len(threads),
+            "requests": len(all_latencies),
+            "errors": sum(1 for status in all_statuses if status != 200),
+            "requests_per_s": len(all_latencies) / usage["wall_s"],
+            "latency": _stage_report({"request": all_latencies})["request"],
+            "stages": _pipeline_stages(),
+            **usage,
+        }
+
+        # /video_feed: several viewers of the first user's webcam session
+        conn, cookie = clients[0]
+        conn.request("POST", "/start_session", headers={"Cookie": cookie})
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Cannot start a session on {video}: HTTP {response.status}")
+        arrivals = [[] for _ in range(options["viewers"])]
+        reset_stages()
+        monitor = ResourceMonitor().start()
+        started = time.perf_counter()
+        deadline = started + duration
+        threads = [threading.Thread(target=_watch_feed, args=(port, cookie, deadline, arrivals[i], duration + 10))
+                   for i in range(options["viewers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        usage = monitor.stop()
+        conn.request("POST", "/stop_session", headers={"Cookie": cookie})
+        conn.getresponse().read()
+        gaps = [b - a for viewer in arrivals for a, b in zip(viewer, viewer[1:])]
+        first_frames = [viewer[0] - started for viewer in arrivals if viewer]
+        video_feed = {
+            "viewers": len(threads),
+            "frames": sum(len(viewer) for viewer in arrivals),
+            "viewer_fps": float(np.mean([len(viewer) for viewer in arrivals])) / usage["wall_s"] if arrivals else 0.0,
+            "first_frame_ms": float(np.mean(first_frames)) * 1000 if first_frames else 0.0,
+            "frame_gap": _stage_report({"gap": gaps})["gap"],
+            "stages": _pipeline_stages(),
+            **usage,
+        }
+        held_streams = _measure_held_streams(port, clients, jpegs, options) if options["streams"] else None
+        for conn, _ in clients:
+            conn.close()
+    finally:
+        stop_server()
+        webapp.session_manager.shutdown()
+    return {
+        # Werkzeug results keep their original names so older result files still compare
+        "name": f"http/{name}" if options["server"] == "werkzeug" else f"http/{options['server']}/{name}",
+        "video": video,
+        "resolution": _video_resolution(video),
+        "server": options["server"],
+        "predict_emotion": predict,
+        "video_feed": video_feed,
+        "held_streams": held_streams,
+        "database": database.stats(),
+    }
+
+
+def _measure_held_streams(port, clients, jpegs, options):
+    # Hundreds of open /video_feed streams while other users post frames and load their dashboards
+    conn, cookie = clients[0]
+    conn.request("POST", "/start_session", headers={"Cookie": cookie})
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f"Cannot start a session: HTTP {response.status}")
+    count = options["streams"]
+    frames = [0] * count
+    first_frames = [None] * count
+    started = time.perf_counter()
+    deadline = started + options["duration"] + 5
+    holder = threading.Thread(target=asyncio.run,
+                              args=(_hold_streams(port, cookie, count, deadline, frames, first_frames),))
+    holder.start()
+    time.sleep(5)  # Let every stream connect before measuring the other endpoints
+
+    measured = time.perf_counter()
+    end = measured + options["duration"]
+    requests = {path: ([], []) for path in ("/predict_emotion", "/dashboard")}
+    workers = []
+    for i, (client, client_cookie) in enumerate(clients[:options["clients"]]):
+        latencies, statuses = requests["/predict_emotion"]
+        workers.append(threading.Thread(target=_post_frames,
+                                        args=(client, client_cookie, jpegs, i * 7, end, latencies, statuses)))
+    dashboard = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    workers.append(threading.Thread(target=_get_repeatedly,
+                                    args=(dashboard, cookie, "/dashboard", end, *requests["/dashboard"])))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - measured
+    holder.join()
+    dashboard.close()
+    conn.request("POST", "/stop_session", headers={"Cookie": cookie})
+    conn.getresponse().read()
+
+    connected = [first - started for first in first_frames if first is not None]
+    return {
+        "streams": count,
+        "streams_served": len(connected),
+        "viewer_fps": float(np.mean(frames)) / (deadline - started),
+        "first_frame_ms": float(np.mean(connected)) * 1000 if connected else 0.0,
+        "predict_emotion": _request_report(*requests["/predict_emotion"], wall),
+        "dashboard": _request_report(*requests["/dashboard"], wall),
+    }
+
+
+def benchmark_http(name, video, options):
+    """Load-test /predict_emotion and /video_feed of the app served locally against a fake database."""
+    return [_run_isolated(_measure_http, name, video, options)]
+
+
+def _print_http_report(report):
+    predict, feed = report["predict_emotion"], report["video_feed"]
+    latency = predict["latency"]
+    print(f"[{report['name']}] /predict_emotion  {predict['clients']} clients  "
+          f"{predict['requests_per_s']:.1f} req/s  p50 {latency['p50_ms']:.1f} ms  p99 {latency['p99_ms']:.1f} ms  "
+          f"errors {predict['errors']}  cpu {predict['cpu_percent']:.0f}%  peak rss {predict['peak_rss_mb']:.0f} MB")
+    gap = feed["frame_gap"]
+    print(f"[{report['name']}] /video_feed  {feed['viewers']} viewers  {feed['viewer_fps']:.1f} fps per viewer  "
+          f"first frame {feed['first_frame_ms']:.0f} ms  gap p50 {gap['p50_ms']:.1f} ms  p99 {gap['p99_ms']:.1f} ms  "
+          f"cpu {feed['cpu_percent']:.0f}%")
+    _print_stages(feed["stages"], "  stream   ")
+    held = report.get("held_streams")
+    if held:
+        print(f"[{report['name']}] {held['streams']} held streams  {held['streams_served']} served  "
+              f"{held['viewer_fps']:.1f} fps per viewer  first frame {held['first_frame_ms']:.0f} ms")
+        for path in ("predict_emotion", "dashboard"):
+            stats = held[path]
+            print(f"  /{path:<16} {stats['requests_per_s']:7.1f} req/s  p50 {stats['latency']['p50_ms']:7.1f} ms  "
+                  f"p99 {stats['latency']['p99_ms']:7.1f} ms  errors {stats['errors']}")
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def _flatten(report, prefix=""):
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def _direction(metric):
+    # 1 when higher is better, -1 when lower is better, 0 for counts and settings
+    if metric.endswith(("fps", "_per_s")):
+        return 1
+    if metric.endswith(("_ms", "_mb")):
+        return -1
+    return 0
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """Rates, latencies and memory that moved by more than threshold (a fraction) between two result files.
+
+    Results are matched by name; each change says whether it is a regression.
+    """
+    previous_results = {result["name"]: result for result in baseline["results"]}
+    changes = []
+    for result in current["results"]:
+        if result["name"] not in previous_results:
+            continue
+        before = _flatten(previous_results[result["name"]])
+        for metric, value in _flatten(result).items():
+            previous = before.get(metric)
+            direction = _direction(metric)
+            if not direction or not previous:
+                continue
+            change = (value - previous) / previous
+            if abs(change) > threshold:
+                changes.append({"name": result["name"], "metric": metric, "baseline": previous,
+                                "current": value, "change": change, "regression": change * direction < 0})
+    return changes
+
+
+def _print_comparison(changes, threshold):
+    if not changes:
+        print(f"No metric moved by more than {threshold:.0%}")
+    for change in changes:
+        label = "REGRESSION" if change["regression"] else "improved"
+        print(f"{label:<10} {change['name']}  {change['metric']}: {change['baseline']:.2f} -> "
+              f"{change['current']:.2f} ({change['change']:+.0%})")
+
+
+def _resolution(value):
+    width, _, height = value.lower().partition("x")
+    if not (width.isdigit() and height.isdigit()):
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the emotion detection pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    detectors = subparsers.add_parser("detectors", help="Compare face detector options on a video file")
+    detectors.add_argument("video", help="Path to a fixed video file")
+    detectors.add_argument("--detectors", nargs="+", choices=FACE_DETECTORS, default=list(FACE_DETECTORS))
+    detectors.add_argument("--frames", type=int, default=300, help="Maximum frames per detector")
+    detectors.add_argument("--json", help="Write the results to this JSON file")
+
+    tracker = subparsers.add_parser("tracker", help="Benchmark face tracking on synthetic scenes")
+    tracker.add_argument("--faces", type=int, nargs="+", default=[1, 10, 50, 100, 200])
+    tracker.add_argument("--frames", type=int, default=100, help="Frames per scene")
+    tracker.add_argument("--json", help="Write the results to this JSON file")
+
+    backends = subparsers.add_parser("backends", help="Compare emotion backends for parity, speed and memory")
+    backends.add_argument("source", help="Video file or image directory with faces")
+    backends.add_argument("--backends", nargs="+", choices=EMOTION_BACKENDS, default=list(EMOTION_BACKENDS))
+    backends.add_argument("--onnx-model", help="ONNX model to test (default: models/emotion_model.onnx)")
+    backends.add_argument("--tflite-model", help="TFLite model to test (default: models/emotion_model.tflite)")
+    backends.add_argument("--faces", type=int, default=500, help="Maximum faces to classify")
+    backends.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    backends.add_argument("--repeats", type=int, default=50, help="Timed calls per batch size")
+    backends.add_argument("--min-agreement", type=float,
+                          help="Exit with an error if a backend agrees with fer on fewer faces (0..1)")
+    backends.add_argument("--json", help="Write the results to this JSON file")
+
+    # Options shared by the pipeline and http benchmarks
+    session_options = argparse.ArgumentParser(add_help=False)
+    session_options.add_argument("--backend", choices=INFERENCE_BACKENDS, default="thread")
+    session_options.add_argument("--workers", type=int, default=4, help="Inference workers")
+    session_options.add_argument("--face-detector", choices=FACE_DETECTORS, default="haar")
+    session_options.add_argument("--emotion-backend", choices=EMOTION_BACKENDS, default="fer")
+    session_options.add_argument("--model-path", help="Model file for the onnx / tflite emotion backends")
+    session_options.add_argument("--detect-interval", type=int, default=1)
+    session_options.add_argument("--full-scan-interval", type=int, default=5,
+                                 help="Scan whole frames every N detections, only around known faces in between")
+    session_options.add_argument("--result-cache-threshold", type=float, default=0.03,
+                                 help="Reuse a face's emotion while its crop changed less than this (0 to disable)")
+    session_options.add_argument("--result-cache-ttl", type=float, default=2.0,
+                                 help="Seconds a cached emotion is reused at most")
+    session_options.add_argument("--duration", type=float, default=10.0, help="Seconds per measurement")
+    session_options.add_argument("--db-latency-ms", type=float, default=0.0,
+                                 help="Simulated round trip per statement of the fake database")
+    session_options.add_argument("--fixture-dir", default=DEFAULT_FIXTURE_DIR,
+                                 help="Where generated fixture videos are cached")
+    session_options.add_argument("--fixture-frames", type=int, default=150, help="Frames per generated video")
+    session_options.add_argument("--json", help="Write the results and environment to this JSON file")
+
+    pipeline = subparsers.add_parser("pipeline", parents=[session_options],
+                                     help="Measure a detection session on synthetic and recorded videos")
+    pipeline.add_argument("--video", action="append", default=[], help="Recorded video to add (repeatable)")
+    pipeline.add_argument("--resolutions", type=_resolution, nargs="*", default=[(640, 480), (1280, 720)],
+                          help="Synthetic video sizes, e.g. 640x480 (none to skip synthetic videos)")
+    pipeline.add_argument("--faces", type=int, nargs="+", default=[1, 4], help="Faces per synthetic video")
+    pipeline.add_argument("--viewers", type=int, default=1, help="MJPEG viewers consuming generate_frames")
+    pipeline.add_argument("--client-frames", type=int, default=100,
+                          help="Frames timed through process_client_frame")
+
+    load = subparsers.add_parser("http", parents=[session_options],
+                                 help="Load-test /predict_emotion and /video_feed against a fake database")
+    load.add_argument("--video", help="Recorded video to use (default: a synthetic 640x480 video with 2 faces)")
+    load.add_argument("--clients", type=int, default=4, help="Concurrent /predict_emotion clients")
+    load.add_argument("--viewers", type=int, default=4, help="Concurrent /video_feed viewers")
+    load.add_argument("--server", choices=("werkzeug", "asgi"), default="werkzeug",
+                      help="Threaded development server, or serve.py's uvicorn front end")
+    load.add_argument("--threads", type=int, default=32, help="Flask route threads of the asgi server")
+    load.add_argument("--stream-threads", type=int, default=8, help="Encoding threads of the asgi server")
+    load.add_argument("--streams", type=int, default=200,
+                      help="Streams held open while /predict_emotion and /dashboard are timed (0 to skip)")
+
+    allocations = subparsers.add_parser("allocations", help="Measure memory allocated per frame in each stage")
+    allocations.add_argument("--video", help="Video to use (default: a synthetic 640x480 video with 2 faces)")
+    allocations.add_argument("--frames", type=int, default=200, help="Frames measured after the warm-up")
+    allocations.add_argument("--warmup", type=int, default=20, help="Frames run before measuring")
+    allocations.add_argument("--face-detector", choices=FACE_DETECTORS, default="haar")
+    allocations.add_argument("--emotion-backend", choices=EMOTION_BACKENDS, default="fer")
+    allocations.add_argument("--model-path", help="Model file for the onnx / tflite emotion backends")
+    allocations.add_argument("--fixture-dir", default=DEFAULT_FIXTURE_DIR,
+                             help="Where generated fixture videos are cached")
+    allocations.add_argument("--fixture-frames", type=int, default=150, help="Frames per generated video")
+    allocations.add_argument("--json", help="Write the results to this JSON file")
+
+    cache = subparsers.add_parser("cache", help="Tune the face result cache threshold against accuracy")
+    cache.add_argument("source", nargs="?",
+                       help="Recorded video or image directory (default: a synthetic 640x480 video with 2 faces)")
+    cache.add_argument("--thresholds", type=float, nargs="+", default=[0.01, 0.02, 0.03, 0.05, 0.08])
+    cache.add_argument("--ttl", type=float, default=2.0, help="Seconds a cached emotion is reused at most")
+    cache.add_argument("--frames", type=int, help="Stop after this many frames")
+    cache.add_argument("--face-detector", choices=FACE_DETECTORS, default="haar")
+    cache.add_argument("--emotion-backend", choices=EMOTION_BACKENDS, default="fer")
+    cache.add_argument("--model-path", help="Model file for the onnx / tflite emotion backends")
+    cache.add_argument("--fixture-dir", default=DEFAULT_FIXTURE_DIR, help="Where generated fixture videos are cached")
+    cache.add_argument("--fixture-frames", type=int, default=150, help="Frames per generated video")
+    cache.add_argument("--json", help="Write the results to this JSON file")
+
+    compare = subparsers.add_parser("compare", help="Compare two pipeline / http result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1,
+                         help="Report changes larger than this fraction; exit with an error on regressions")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        changes = compare_results(baseline, current, args.threshold)
+        _print_comparison(changes, args.threshold)
+        if any(change["regression"] for change in changes):
+            parser.exit(1)
+        return
+
+    if args.command == "detectors":
+        reports = [benchmark_detector(args.video, name, args.frames) for name in args.detectors]
+        for report in reports:
+            _print_detector_report(report)
+    elif args.command == "tracker":
+        reports = benchmark_tracker(args.faces, args.frames)
+        for report in reports:
+            _print_tracker_report(report)
+    elif args.command == "backends":
+        model_paths = {"onnx": args.onnx_model, "tflite": args.tflite_model}
+        reports = benchmark_backends(args.source, args.backends, model_paths, args.faces,
+                                     args.batch_sizes, args.repeats)
+        for report in reports:
+            _print_backend_report(report)
+    elif args.command == "pipeline":
+        videos = fixture_videos(args.fixture_dir, args.resolutions, args.faces, args.fixture_frames)
+        videos += [(os.path.splitext(os.path.basename(path))[0], path) for path in args.video]
+        reports = benchmark_pipeline(videos, vars(args))
+        for report in reports:
+            _print_pipeline_report(report)
+    elif args.command == "http":
+        if args.video:
+            name, video = os.path.splitext(os.path.basename(args.video))[0], args.video
+        else:
+            name, video = fixture_videos(args.fixture_dir, [(640, 480)], [2], args.fixture_frames)[0]
+        reports = benchmark_http(name, video, vars(args))
+        for report in reports:
+            _print_http_report(report)
+    elif args.command == "allocations":
+        video = args.video or fixture_videos(args.fixture_dir, [(640, 480)], [2], args.fixture_frames)[0][1]
+        reports = benchmark_allocations(video, args.face_detector, args.emotion_backend, args.model_path,
+                                        args.frames, args.warmup)
+        for report in reports:
+            _print_allocation_report(report)
+    elif args.command == "cache":
+        source = args.source or fixture_videos(args.fixture_dir, [(640, 480)], [2], args.fixture_frames)[0][1]
+        reports = benchmark_cache(source, args.thresholds, args.face_detector, args.emotion_backend,
+                                  args.model_path, args.frames, args.ttl)
+        for report in reports:
+            _print_cache_report(report)
+
+    if args.json:
+        if args.command in ("pipeline", "http"):
+            # Self-describing, so compare can line results up across runs and machines
+            reports = {"environment": _environment(), "settings": vars(args), "results": reports}
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+    if args.command == "backends" and args.min_agreement is not None:
+        failed = [r["backend"] for r in reports if r.get("agreement", 1.0) < args.min_agreement]
+        if failed:
+            parser.exit(1, f"Below {args.min_agreement:.0%} agreement with fer: {', '.join(failed)}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import os
+import re
+import time
+import resource
+import threading
+import multiprocessing
+import cv2
+import numpy as np
+import database_setup
+from database_setup import ConnectionPool
+
+MOUTHS = ('smile', 'frown', 'open', 'flat')
+
+
+def draw_face(size, mouth='smile'):
+    """A frontal cartoon face that the Haar cascade reliably detects, as a size x size BGR image."""
+    s = 200  # Drawn at a fixed size and scaled, so every size looks the same
+    face = np.full((s, s, 3), (90, 110, 130), dtype=np.uint8)
+    cv2.ellipse(face, (100, 104), (72, 92), 0, 0, 360, (150, 180, 215), -1)
+    for ex in (68, 132):
+        cv2.ellipse(face, (ex, 66), (20, 5), 0, 0, 360, (40, 50, 60), -1)
+        cv2.ellipse(face, (ex, 84), (16, 9), 0, 0, 360, (245, 245, 245), -1)
+        cv2.circle(face, (ex, 84), 7, (30, 30, 30), -1)
+    cv2.ellipse(face, (100, 116), (10, 20), 0, 0, 360, (120, 150, 185), -1)
+    if mouth == 'smile':
+        cv2.ellipse(face, (100, 140), (30, 16), 0, 10, 170, (70, 70, 150), 6)
+    elif mouth == 'frown':
+        cv2.ellipse(face, (100, 160), (30, 14), 0, 190, 350, (70, 70, 150), 6)
+    elif mouth == 'open':
+        cv2.ellipse(face, (100, 150), (16, 14), 0, 0, 360, (40, 40, 90), -1)
+    else:
+        cv2.ellipse(face, (100, 148), (28, 8), 0, 0, 360, (70, 70, 150), -1)
+    face = cv2.GaussianBlur(face, (0, 0), 4)
+    return cv2.resize(face, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def make_fixture_video(path, size=(640, 480), faces=1, frames=150, fps=15, seed=0):
+    """Write a deterministic MJPG video of faces drifting over a textured background.
+
+    Face size scales with the frame so every resolution shows the same scene;
+    the same arguments always produce the same frames.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(40, 200, (height, width, 3), dtype=np.uint8), (0, 0), 8)
+    side = int(min(width, height) * (0.4 if faces <= 1 else 0.7 / np.sqrt(faces)))
+    sprites = [draw_face(side, MOUTHS[i % len(MOUTHS)]) for i in range(faces)]
+    limit = np.array([width - side, height - side], dtype=float)
+    positions = rng.uniform([0, 0], limit, (faces, 2))
+    velocities = rng.uniform(-1, 1, (faces, 2)) * side * 0.03
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"Cannot write video: {path}")
+    try:
+        for _ in range(frames):
+            frame = background.copy()
+            for sprite, (x, y) in zip(sprites, positions.astype(int)):
+                frame[y:y + side, x:x + side] = sprite
+            writer.write(frame)
+            positions += velocities
+            outside = (positions < 0) | (positions > limit)
+            velocities[outside] *= -1
+            positions = np.clip(positions, 0, limit)
+    finally:
+        writer.release()
+    return path
+
+
+def fixture_videos(directory, resolutions=((640, 480),), face_counts=(1,), frames=150):
+    """Synthetic fixture videos for every resolution and face count as [(name, path)], created when missing."""
+    os.makedirs(directory, exist_ok=True)
+    videos = []
+    for width, height in resolutions:
+        for faces in face_counts:
+            name = f"synthetic_{width}x{height}_{faces}faces"
+            path = os.path.join(directory, f"{name}_{frames}f.avi")
+            if not os.path.exists(path):
+                make_fixture_video(path, (width, height), faces, frames)
+            videos.append((name, path))
+    return videos
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+        self.lastrowid = None
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def execute(self, query, args=None):
+        self.rows, self.lastrowid = self.database.execute(query, args)
+        self.rowcount = len(self.rows)
+        return self.rowcount
+
+    def executemany(self, query, args):
+        args = list(args)
+        self.rows, self.lastrowid = self.database.execute(query, args, many=True)
+        self.rowcount = len(args)
+        return self.rowcount
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.open = True
+
+    def cursor(self, cursor=None):
+        return FakeCursor(self.database)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+class FakeDatabase:
+    """In-memory stand-in for MySQL that answers the app's queries well enough to serve requests.
+
+    Users are looked up by name, new sessions get increasing IDs and everything
+    else succeeds without storing anything. Each statement (one per
+    executemany) can cost latency seconds, like a network round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.users = {}  # username -> row
+        self.lock = threading.Lock()
+        self.next_session_id = 1
+        self.statements = 0
+        self.logged_rows = 0
+
+    def add_user(self, username, password_hash):
+        with self.lock:
+            user_id = len(self.users) + 1
+            self.users[username] = {'id': user_id, 'username': username, 'password': password_hash}
+        return user_id
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def execute(self, query, args=None, many=False):
+        if self.latency:
+            time.sleep(self.latency)
+        query = re.sub(r'\s+', ' ', query).strip()
+        with self.lock:
+            self.statements += 1
+            if query.startswith('INSERT INTO emotion_logs'):
+                self.logged_rows += len(args)
+            if query.startswith('INSERT INTO sessions'):
+                self.next_session_id += 1
+                return [], self.next_session_id - 1
+            if 'FROM users WHERE username' in query:
+                user = self.users.get(args[0])
+                return ([dict(user)] if user else []), None
+            if query.startswith('SELECT * FROM dashboard_stats'):
+                return [{'id': 1, 'total_sessions': 0, 'total_faces_detected': 0,
+                         'most_common_emotion': 'N/A', 'last_updated': None}], None
+        return [], None
+
+    def stats(self):
+        with self.lock:
+            return {"statements": self.statements, "logged_rows": self.logged_rows}
+
+
+class FakeConnectionPool(ConnectionPool):
+    """The real connection pool, handing out FakeDatabase connections."""
+
+    def __init__(self, database, **kwargs):
+        super().__init__({}, **kwargs)
+        self.database = database
+
+    def _connect(self):
+        conn = self.database.connect()
+        with self.condition:
+            self.created += 1
+        return conn
+
+
+def install_fake_database(latency=0.0, max_size=10):
+    """Point database_setup.db_connection at a FakeDatabase; call before importing app."""
+    database = FakeDatabase(latency)
+    database_setup.pool = FakeConnectionPool(database, max_size=max_size)
+    return database
+
+
+def _proc_cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def _proc_peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class ResourceMonitor:
+    """CPU time and peak memory of this process and its worker processes over an interval.
+
+    cpu_percent is CPU seconds per wall second, so it can exceed 100 with
+    several cores busy. Worker figures need /proc (Linux).
+    """
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.self_cpu = self._self_cpu()
+        self.children_cpu = {p.pid: _proc_cpu_seconds(p.pid) for p in multiprocessing.active_children()}
+        return self
+
+    @staticmethod
+    def _self_cpu():
+        times = os.times()
+        return times.user + times.system
+
+    def stop(self):
+        wall = time.perf_counter() - self.started
+        cpu = self._self_cpu() - self.self_cpu
+        children = multiprocessing.active_children()
+        for child in children:
+            cpu += _proc_cpu_seconds(child.pid) - self.children_cpu.get(child.pid, 0.0)
+        # ru_maxrss is in KiB on Linux
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "cpu_percent": cpu / wall * 100 if wall > 0 else 0.0,
+            "cpu_count": os.cpu_count(),
+            "peak_rss_mb": peak_rss,
+            "workers_peak_rss_mb": sum(_proc_peak_rss_mb(child.pid) for child in children),
+        }
@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+
+
+class OpticalFlowPropagator:
+    """Moves face boxes between full detections with pyramidal Lucas-Kanade optical flow.
+
+    reset() seeds feature points inside each detected box; propagate() follows
+    them into the next grayscale frame and shifts/scales every box by the median
+    motion of its points. Each box gets a confidence, the fraction of its points
+    that were tracked, so callers can fall back to full detection.
+    """
+
+    def __init__(self, max_points=30, min_points=4):
+        self.max_points = max_points
+        self.min_points = min_points
+        self.prev_gray = None
+        self.tracks = []  # (box, points) per face
+
+    def reset(self, gray, boxes):
+        self.prev_gray = gray
+        self.tracks = [(tuple(int(v) for v in box), self._features(gray, box)) for box in boxes]
+
+    def _features(self, gray, box):
+        x, y, w, h = (int(v) for v in box)
+        x, y = max(0, x), max(0, y)
+        roi = gray[y:y+h, x:x+w]
+        if roi.size == 0:
+            return np.empty((0, 1, 2), dtype=np.float32)
+        points = cv2.goodFeaturesToTrack(roi, maxCorners=self.max_points, qualityLevel=0.01, minDistance=3)
+        if points is None:
+            return np.empty((0, 1, 2), dtype=np.float32)
+        return (points + np.array([x, y], dtype=np.float32)).astype(np.float32)
+
+    def _move_box(self, box, old_points, new_points, shape):
+        x, y, w, h = box
+        dx, dy = np.median(new_points - old_points, axis=0).ravel()
+        # Scale from how the spread of the points around their centre changed
+        old_spread = np.linalg.norm(old_points - old_points.mean(axis=0), axis=-1)
+        new_spread = np.linalg.norm(new_points - new_points.mean(axis=0), axis=-1)
+        valid = old_spread > 1e-3
+        scale = float(np.median(new_spread[valid] / old_spread[valid])) if valid.any() else 1.0
+        cx, cy = x + w / 2 + dx, y + h / 2 + dy
+        w, h = w * scale, h * scale
+        x = int(round(min(max(cx - w / 2, 0), shape[1] - 1)))
+        y = int(round(min(max(cy - h / 2, 0), shape[0] - 1)))
+        return (x, y, int(round(w)), int(round(h)))
+
+    def propagate(self, gray):
+        """Return the moved boxes and their confidences (0..1) for the new frame."""
+        if self.prev_gray is None or not self.tracks:
+            self.prev_gray = gray
+            return [], []
+
+        counts = [len(points) for _, points in self.tracks]
+        all_points = np.concatenate([points for _, points in self.tracks])
+        if len(all_points):
+            next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+                self.prev_gray, gray, all_points, None, winSize=(15, 15), maxLevel=2)
+            status = status.ravel() == 1
+        else:
+            next_points, status = all_points, np.zeros(0, dtype=bool)
+
+        boxes = []
+        confidences = []
+        tracks = []
+        start = 0
+        for (box, points), count in zip(self.tracks, counts):
+            ok = status[start:start + count]
+            old_points, new_points = points[ok], next_points[start:start + count][ok]
+            start += count
+            if count == 0 or ok.sum() < self.min_points:
+                boxes.append(box)
+                confidences.append(0.0)
+                tracks.append((box, points))
+                continue
+            box = self._move_box(box, old_points, new_points, gray.shape)
+            boxes.append(box)
+            confidences.append(float(ok.sum()) / count)
+            tracks.append((box, new_points.reshape(-1, 1, 2)))
+
+        self.tracks = tracks
+        self.prev_gray = gray
+        return boxes, confidences
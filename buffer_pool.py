@@ -0,0 +1,51 @@
+import threading
+import numpy as np
+
+
+class FramePool:
+    """Reusable frame arrays, handed out with a reference count.
+
+    acquire() returns a free array of the requested shape and only allocates
+    when none is left. Every holder that keeps a frame beyond its producer
+    calls retain(), and each holder calls release() when done; at zero
+    references the array goes back to the pool. Arrays that did not come from
+    the pool are ignored, so callers need not know where a frame came from.
+    """
+
+    def __init__(self, max_free=8):
+        self.max_free = max_free  # Free arrays kept per shape
+        self.lock = threading.Lock()
+        self.free = {}  # (shape, dtype) -> [array]
+        self.refs = {}  # id(array) -> [array, references]
+        self.allocated = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            free = self.free.get(key)
+            if free:
+                frame = free.pop()
+            else:
+                frame = np.empty(shape, dtype=dtype)
+                self.allocated += 1
+            self.refs[id(frame)] = [frame, 1]
+        return frame
+
+    def retain(self, frame):
+        with self.lock:
+            entry = self.refs.get(id(frame))
+            if entry is not None and entry[0] is frame:
+                entry[1] += 1
+
+    def release(self, frame):
+        with self.lock:
+            entry = self.refs.get(id(frame))
+            if entry is None or entry[0] is not frame:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self.refs[id(frame)]
+            free = self.free.setdefault((frame.shape, frame.dtype), [])
+            if len(free) < self.max_free:
+                free.append(frame)
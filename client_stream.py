@@ -0,0 +1,176 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+import cv2
+import numpy as np
+from simple_websocket import ConnectionClosed
+
+logger = logging.getLogger(__name__)
+
+
+def decode_image(data):
+    """Decode an uploaded JPEG/PNG; None when data is empty or not an image."""
+    if not len(data):
+        return None  # imdecode raises on an empty buffer instead of returning None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def frame_result(detection_session, data, received_at, dropped):
+    """Decode one JPEG frame from the browser, analyze it and build the message sent back."""
+    frame = decode_image(data)
+    if frame is None:
+        return {"type": "error", "message": "Invalid image"}
+    summary = detection_session.process_client_frame(frame)
+    faces = [
+        {"id": int(fid), "emotion": emotion, "box": [int(v) for v in box]}
+        for fid, (_, emotion, box) in detection_session.face_tracker.items()
+    ]
+    return {
+        "type": "result",
+        "summary": summary,
+        "faces": faces,
+        "dropped": dropped,
+        "latency_ms": round((time.perf_counter() - received_at) * 1000, 1),
+    }
+
+
+class ClientFrameStream:
+    """Bridges one browser WebSocket to the user's DetectionSession.
+
+    The browser pushes JPEG frames as binary messages and gets a JSON result
+    back for each frame it processed. A reader thread keeps only the newest
+    frame, so when inference falls behind stale frames are dropped instead of
+    queueing up latency. While no frames arrive (server webcam mode) the
+    current summary is pushed every summary_interval seconds.
+    """
+
+    def __init__(self, ws, detection_session, summary_interval=1.0):
+        self.ws = ws
+        self.detection_session = detection_session
+        self.summary_interval = summary_interval
+        self.condition = threading.Condition()
+        self.pending = None
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def _receive_frames(self):
+        try:
+            while True:
+                data = self.ws.receive()
+                if not isinstance(data, (bytes, bytearray)):
+                    continue
+                with self.condition:
+                    if self.pending is not None:
+                        self.dropped += 1
+                    self.pending = (data, time.perf_counter())
+                    self.received += 1
+                    self.condition.notify()
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"WebSocket receive error: {e}")
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify()
+
+    def _next_frame(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending is not None or self.closed,
+                                    timeout=self.summary_interval)
+            item = self.pending
+            self.pending = None
+            return item
+
+    def _send(self, message):
+        self.ws.send(json.dumps(message))
+
+    def _process(self, data, received_at):
+        self._send(frame_result(self.detection_session, data, received_at, self.dropped))
+
+    def run(self):
+        reader = threading.Thread(target=self._receive_frames, daemon=True)
+        reader.start()
+        try:
+            while not self.closed:
+                item = self._next_frame()
+                if item is None:
+                    if not self.closed:
+                        self._send({"type": "summary", "summary": self.detection_session.emotion_summary})
+                    continue
+                self._process(*item)
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"WebSocket stream error: {e}")
+        logger.info(f"WebSocket stream closed: {self.received} frames received, {self.dropped} dropped")
+
+
+class AsyncClientFrameStream:
+    """ClientFrameStream for a Starlette WebSocket under an ASGI server.
+
+    Same protocol and newest-frame-wins behaviour, but receiving and waiting
+    are coroutines; decoding and inference run on the event loop's default
+    executor, so no thread is tied up while a browser is idle.
+    """
+
+    def __init__(self, websocket, detection_session, summary_interval=1.0):
+        self.websocket = websocket
+        self.detection_session = detection_session
+        self.summary_interval = summary_interval
+        self.arrived = asyncio.Event()
+        self.pending = None
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    async def _receive_frames(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if data is None:
+                    continue
+                if self.pending is not None:
+                    self.dropped += 1
+                self.pending = (data, time.perf_counter())
+                self.received += 1
+                self.arrived.set()
+        except Exception as e:
+            logger.error(f"WebSocket receive error: {e}")
+        finally:
+            self.closed = True
+            self.arrived.set()
+
+    async def _send(self, message):
+        await self.websocket.send_text(json.dumps(message))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        await self.websocket.accept()
+        reader = asyncio.create_task(self._receive_frames())
+        try:
+            while not self.closed:
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), self.summary_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.arrived.clear()
+                item, self.pending = self.pending, None
+                if item is None:
+                    if not self.closed:
+                        await self._send({"type": "summary", "summary": self.detection_session.emotion_summary})
+                    continue
+                await self._send(await loop.run_in_executor(
+                    None, frame_result, self.detection_session, *item, self.dropped))
+        except Exception as e:
+            if not self.closed:
+                logger.error(f"WebSocket stream error: {e}")
+        finally:
+            reader.cancel()
+        logger.info(f"WebSocket stream closed: {self.received} frames received, {self.dropped} dropped")
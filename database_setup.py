@@ -1,5 +1,10 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
 import pymysql
 from pymysql.cursors import DictCursor
+from metrics import DB_SECONDS
 
 db_config = {
     "host": "localhost",
@@ -11,68 +16,312 @@ db_config = {
     "charset": "utf8mb4"
 }
 
-def get_db_connection():
+class PoolTimeout(pymysql.OperationalError):
+    pass
+
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections.
+
+    Connections are opened on demand up to max_size and kept idle for reuse,
+    with at least min_size opened on first use. A connection that sat idle
+    longer than ping_interval is pinged (and reconnected if needed) before
+    it is handed out. When every connection is busy, acquire() waits up to
+    acquire_timeout seconds and then raises PoolTimeout.
+    """
+
+    def __init__(self, config, min_size=1, max_size=10, acquire_timeout=5.0, ping_interval=30.0):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.ping_interval = ping_interval
+        self.condition = threading.Condition()
+        self.idle = []  # (connection, time it was released)
+        self.size = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+
+    def _connect(self):
+        conn = pymysql.connect(**self.config)
+        with self.condition:
+            self.created += 1
+        return conn
+
+    def _fill(self):
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            try:
+                conn = self._connect()
+            except pymysql.MySQLError:
+                with self.condition:
+                    self.size -= 1
+                raise
+            with self.condition:
+                self.idle.append((conn, time.monotonic()))
+                self.condition.notify()
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        if self.size < self.min_size:
+            self._fill()
+
+        with self.condition:
+            started = time.monotonic()
+            # Queue behind existing waiters so a thread that just released cannot barge ahead
+            if self.waiting or (not self.idle and self.size >= self.max_size):
+                self.waits += 1
+                self.waiting += 1
+                try:
+                    available = self.condition.wait_for(
+                        lambda: self.idle or self.size < self.max_size, timeout=timeout)
+                finally:
+                    self.waiting -= 1
+                self.wait_time += time.monotonic() - started
+                if not available:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {timeout}s")
+            conn, released_at = self.idle.pop() if self.idle else (None, None)
+            if conn is None:
+                self.size += 1
+            self.in_use += 1
+            if self.waiting and (self.idle or self.size < self.max_size):
+                self.condition.notify()
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - released_at > self.ping_interval:
+                try:
+                    conn.ping(reconnect=True)
+                except pymysql.MySQLError:
+                    with self.condition:
+                        self.health_check_failures += 1
+                    conn = self._connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        with self.condition:
+            self.in_use -= 1
+            if discard or not conn.open:
+                self.size -= 1
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+        if discard:
+            try:
+                conn.close()
+            except pymysql.Error:
+                pass
+
+    def close(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "size": self.size,
+                "idle": len(self.idle),
+                "in_use": self.in_use,
+                "max_size": self.max_size,
+                "created": self.created,
+                "waits": self.waits,
+                "wait_time_ms": self.wait_time * 1000,
+                "timeouts": self.timeouts,
+                "health_check_failures": self.health_check_failures,
+            }
+
+pool = ConnectionPool(
+    db_config,
+    min_size=int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+    max_size=int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+    acquire_timeout=float(os.environ.get("DB_POOL_TIMEOUT", "5.0")),
+)
+
+@contextmanager
+def db_connection(timeout=None):
+    """Borrow a pooled connection for the with-block; yields None if the database is unavailable."""
+    started = time.perf_counter()
     try:
-        return pymysql.connect(**db_config)
+        conn = pool.acquire(timeout)
     except pymysql.MySQLError as e:
         print(f"Database connection failed: {e}")
-        return None
+        conn = None
+    acquired = time.perf_counter()
+    DB_SECONDS.labels('acquire').observe(acquired - started)
+    if conn is None:
+        yield None
+        return
+    discard = False
+    try:
+        yield conn
+    except (pymysql.OperationalError, pymysql.InterfaceError):
+        discard = True
+        raise
+    finally:
+        pool.release(conn, discard=discard)
+        DB_SECONDS.labels('use').observe(time.perf_counter() - acquired)
 
-def init_db():
-    conn = get_db_connection()
-    if not conn:
-        print("Failed to connect to database during initialization")
+def _add_missing_columns(cursor, table, columns):
+    # CREATE TABLE IF NOT EXISTS leaves older tables untouched, so add new columns here
+    cursor.execute('''
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    ''', (table,))
+    existing = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+    for name, definition in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def _add_missing_indexes(cursor, table, indexes):
+    cursor.execute('''
+        SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    ''', (table,))
+    existing = {row['INDEX_NAME'] for row in cursor.fetchall()}
+    for name, columns in indexes:
+        if name not in existing:
+            cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+def _backfill_rollups(cursor):
+    # Seed the rollups from existing logs the first time they are created
+    cursor.execute("SELECT 1 FROM session_emotion_counts LIMIT 1")
+    if cursor.fetchone():
         return
+    cursor.execute('''
+        INSERT INTO session_emotion_counts (session_id, emotion, count)
+        SELECT session_id, emotion, COUNT(*) FROM emotion_logs
+        WHERE session_id IS NOT NULL AND emotion IS NOT NULL
+        GROUP BY session_id, emotion
+    ''')
+    cursor.execute('''
+        INSERT INTO user_emotion_counts (user_id, emotion, count)
+        SELECT s.user_id, c.emotion, SUM(c.count) FROM session_emotion_counts c
+        JOIN sessions s ON s.id = c.session_id
+        WHERE s.user_id IS NOT NULL
+        GROUP BY s.user_id, c.emotion
+        ON DUPLICATE KEY UPDATE count = VALUES(count)
+    ''')
+    cursor.execute('''
+        INSERT INTO global_emotion_counts (emotion, count)
+        SELECT emotion, SUM(count) FROM session_emotion_counts GROUP BY emotion
+        ON DUPLICATE KEY UPDATE count = VALUES(count)
+    ''')
 
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password VARCHAR(255) NOT NULL
-                )
-            ''')
+def init_db():
+    with db_connection() as conn:
+        if not conn:
+            print("Failed to connect to database during initialization")
+            return False
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        username VARCHAR(50) UNIQUE NOT NULL,
+                        password VARCHAR(255) NOT NULL
+                    )
+                ''')
             
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT,
-                    start_time DATETIME,
-                    end_time DATETIME,
-                    total_faces INT DEFAULT 0,
-                    most_common_emotion VARCHAR(20),
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT,
+                        start_time DATETIME,
+                        end_time DATETIME,
+                        total_faces INT DEFAULT 0,
+                        most_common_emotion VARCHAR(20),
+                        FOREIGN KEY (user_id) REFERENCES users(id)
+                    )
+                ''')
             
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS emotion_logs (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    session_id INT,
-                    emotion VARCHAR(20),
-                    FOREIGN KEY (session_id) REFERENCES sessions(id)
-                )
-            ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS emotion_logs (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        session_id INT,
+                        track_id INT,
+                        emotion VARCHAR(20),
+                        confidence FLOAT,
+                        logged_at DATETIME(3),
+                        FOREIGN KEY (session_id) REFERENCES sessions(id)
+                    )
+                ''')
+                _add_missing_columns(cursor, 'emotion_logs', [
+                    ('track_id', 'INT'),
+                    ('confidence', 'FLOAT'),
+                    ('logged_at', 'DATETIME(3)'),
+                ])
             
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS dashboard_stats (
-                    id INT PRIMARY KEY DEFAULT 1,
-                    total_sessions INT DEFAULT 0,
-                    total_faces_detected INT DEFAULT 0,
-                    most_common_emotion VARCHAR(20),
-                    last_updated DATETIME,
-                    CHECK (id = 1)
-                )
-            ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS dashboard_stats (
+                        id INT PRIMARY KEY DEFAULT 1,
+                        total_sessions INT DEFAULT 0,
+                        total_faces_detected INT DEFAULT 0,
+                        most_common_emotion VARCHAR(20),
+                        last_updated DATETIME,
+                        CHECK (id = 1)
+                    )
+                ''')
             
-            cursor.execute('''
-                INSERT IGNORE INTO dashboard_stats (id, total_sessions, total_faces_detected, most_common_emotion, last_updated)
-                VALUES (1, 0, 0, 'N/A', NOW())
-            ''')
+                cursor.execute('''
+                    INSERT IGNORE INTO dashboard_stats (id, total_sessions, total_faces_detected, most_common_emotion, last_updated)
+                    VALUES (1, 0, 0, 'N/A', NOW())
+                ''')
+
+                _add_missing_indexes(cursor, 'sessions', [
+                    ('idx_sessions_user_start', 'user_id, start_time'),
+                ])
+                _add_missing_indexes(cursor, 'emotion_logs', [
+                    ('idx_emotion_logs_session_emotion', 'session_id, emotion'),
+                ])
+
+                # Emotion counts kept up to date by the log writer, so the dashboard never scans emotion_logs
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS session_emotion_counts (
+                        session_id INT NOT NULL,
+                        emotion VARCHAR(20) NOT NULL,
+                        count INT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (session_id, emotion)
+                    )
+                ''')
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_emotion_counts (
+                        user_id INT NOT NULL,
+                        emotion VARCHAR(20) NOT NULL,
+                        count INT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (user_id, emotion)
+                    )
+                ''')
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS global_emotion_counts (
+                        emotion VARCHAR(20) PRIMARY KEY,
+                        count INT NOT NULL DEFAULT 0
+                    )
+                ''')
+                _backfill_rollups(cursor)
             
-        print("Database initialized successfully")
-    except pymysql.MySQLError as e:
-        print(f"Database initialization failed: {e}")
-    finally:
-        conn.close()
\ No newline at end of file
+            print("Database initialized successfully")
+            return True
+        except pymysql.MySQLError as e:
+            print(f"Database initialization failed: {e}")
+            return False
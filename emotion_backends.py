@@ -0,0 +1,204 @@
+import os
+import threading
+import importlib.util
+import numpy as np
+
+EMOTION_BACKENDS = ('fer', 'onnx', 'tflite')
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+DEFAULT_MODEL_PATHS = {
+    'onnx': os.path.join(MODEL_DIR, 'emotion_model.onnx'),
+    'tflite': os.path.join(MODEL_DIR, 'emotion_model.tflite'),
+}
+
+
+def packaged_model_path(filename):
+    """Path of a model file shipped inside the fer package, found without importing fer (and TensorFlow)."""
+    spec = importlib.util.find_spec('fer')
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(list(spec.submodule_search_locations)[0], 'data', filename)
+    return path if os.path.exists(path) else None
+
+
+class EmotionBackend:
+    """Runs the emotion classifier on preprocessed faces.
+
+    classify() takes an (N, 64, 64) float32 batch of grayscale faces scaled to
+    [-1, 1] and returns an (N, 7) array of probabilities ordered like EMOTIONS.
+    Models are loaded on first use, or earlier by calling load().
+    """
+
+    name = None
+
+    def __init__(self):
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        raise NotImplementedError
+
+    def load(self):
+        with self._load_lock:
+            if self._model is None:
+                self._model = self._load()
+        return self
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def classify(self, batch):
+        raise NotImplementedError
+
+
+class FERBackend(EmotionBackend):
+    """The Keras model of the fer package, run by TensorFlow."""
+
+    name = 'fer'
+
+    def __init__(self, mtcnn=False):
+        super().__init__()
+        self.mtcnn = mtcnn
+        # Calling the Keras models (classifier and MTCNN) from several threads at once corrupts memory in TensorFlow 2.13
+        self._model_lock = threading.Lock()
+
+    def _load(self):
+        from fer import FER  # Imports TensorFlow
+        return FER(mtcnn=self.mtcnn)
+
+    def find_faces(self, frame):
+        self.load()
+        with self._model_lock:
+            faces = self._model.find_faces(frame, bgr=True)
+        return [tuple(box) for box in faces]
+
+    def classify(self, batch):
+        self.load()
+        with self._model_lock:
+            return np.asarray(self._model._classify_emotions(batch), dtype=np.float32)
+
+
+class ONNXBackend(EmotionBackend):
+    """An exported ONNX model (see model_export.py) run by ONNX Runtime on the CPU."""
+
+    name = 'onnx'
+
+    def __init__(self, model_path=None, threads=None):
+        super().__init__()
+        self.model_path = model_path or DEFAULT_MODEL_PATHS['onnx']
+        self.threads = threads
+
+    def _load(self):
+        import onnxruntime as ort
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"ONNX emotion model not found: {self.model_path} (create it with model_export.py)")
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.channel_last = len(model_input.shape) == 4
+        return session
+
+    def classify(self, batch):
+        self.load()
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self.channel_last:
+            batch = batch[..., None]
+        # InferenceSession.run is safe to call from several threads at once
+        return self._model.run(None, {self.input_name: batch})[0].astype(np.float32, copy=False)
+
+
+def _tflite_interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter  # Full TensorFlow as a last resort
+    return Interpreter
+
+
+class TFLiteBackend(EmotionBackend):
+    """A TFLite model, float or int8-quantized, run by the LiteRT / tflite-runtime interpreter.
+
+    Without a model path it uses models/emotion_model.tflite, or the quantized
+    model that newer fer releases ship. Interpreters are not thread-safe, so
+    each inference thread builds its own, one per padded batch size.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path=None):
+        super().__init__()
+        self.model_path = model_path or self._default_model_path()
+        self._local = threading.local()
+
+    @staticmethod
+    def _default_model_path():
+        path = DEFAULT_MODEL_PATHS['tflite']
+        if os.path.exists(path):
+            return path
+        return packaged_model_path('emotion_model_quantized.tflite') or path
+
+    def _load(self):
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"TFLite emotion model not found: {self.model_path} (create it with model_export.py)")
+        self.interpreter_class = _tflite_interpreter_class()
+        with open(self.model_path, 'rb') as f:
+            return f.read()
+
+    def _interpreter(self, batch_size):
+        interpreters = getattr(self._local, 'interpreters', None)
+        if interpreters is None:
+            interpreters = self._local.interpreters = {}
+        interpreter = interpreters.get(batch_size)
+        if interpreter is None:
+            interpreter = self.interpreter_class(model_content=self._model)
+            model_input = interpreter.get_input_details()[0]
+            if model_input['shape'][0] != batch_size:
+                interpreter.resize_tensor_input(model_input['index'], [batch_size] + list(model_input['shape'][1:]))
+            interpreter.allocate_tensors()
+            interpreters[batch_size] = interpreter
+        return interpreter
+
+    def classify(self, batch):
+        self.load()
+        count = len(batch)
+        if count == 0:
+            return np.empty((0, 7), dtype=np.float32)
+        # Pad to a power of two so only a handful of tensor layouts are ever allocated
+        padded = 1 << (count - 1).bit_length()
+        interpreter = self._interpreter(padded)
+        model_input = interpreter.get_input_details()[0]
+        model_output = interpreter.get_output_details()[0]
+
+        data = np.zeros((padded,) + tuple(model_input['shape'][1:]), dtype=np.float32)
+        data[:count] = np.asarray(batch, dtype=np.float32).reshape((count,) + data.shape[1:])
+        scale, zero_point = model_input['quantization']
+        if model_input['dtype'] != np.float32:
+            # Fully integer-quantized model: quantize the input ourselves
+            info = np.iinfo(model_input['dtype'])
+            data = np.clip(np.round(data / scale + zero_point), info.min, info.max).astype(model_input['dtype'])
+        interpreter.set_tensor(model_input['index'], data)
+        interpreter.invoke()
+
+        probs = interpreter.get_tensor(model_output['index'])[:count]
+        scale, zero_point = model_output['quantization']
+        if model_output['dtype'] != np.float32:
+            probs = (probs.astype(np.float32) - zero_point) * scale
+        return probs.astype(np.float32, copy=False)
+
+
+def create_emotion_backend(name='fer', model_path=None, mtcnn=False):
+    if name == 'fer':
+        return FERBackend(mtcnn=mtcnn)
+    if mtcnn:
+        raise ValueError("MTCNN face detection needs the fer emotion backend")
+    if name == 'onnx':
+        return ONNXBackend(model_path)
+    if name == 'tflite':
+        return TFLiteBackend(model_path)
+    raise ValueError(f"Unknown emotion backend: {name}")
@@ -1,55 +1,382 @@
+import os
 import cv2
+import itertools
 import threading
 import time
-import queue
 import numpy as np
-from fer import FER
-from database_setup import get_db_connection
-from flask import session
+from database_setup import db_connection
+from emotion_backends import create_emotion_backend
+from frame_broadcaster import FrameBroadcaster
+from frame_buffer import FrameRingBuffer
+from buffer_pool import FramePool
+from box_propagation import OpticalFlowPropagator
+from face_tracker import FaceTracker, box_iou
+from face_search import AdaptiveFaceSearch
+from result_cache import REUSED, FaceResultCache, face_signatures, reuse_results
+from session_stats import SessionStats
+from collections import Counter
+from metrics import observe_stage, FRAMES_CAPTURED, FRAMES_PROCESSED, FACES_TRACKED
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Output order of the FER emotion classifier
+EMOTIONS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+FACE_INPUT_SIZE = (64, 64)
+FACE_OFFSETS = (10, 10)
+FACE_DETECTORS = ('haar', 'mtcnn')
+DETECT_SIZE = (320, 240)  # Faces are searched for in a copy of each frame at this size
+DISPLAY_SIZE = (640, 480)  # Coordinates of the returned face boxes and of annotated frames
+DISPLAY_SCALE = DISPLAY_SIZE[0] // DETECT_SIZE[0]
+FACE_LOG_SAMPLE = 100  # With debug logging on, log the probabilities of one face in this many
+# Classifier input for each grayscale value: contrast boost, then scaling to [-1, 1]
+INPUT_LUT = (cv2.convertScaleAbs(np.arange(256, dtype=np.uint8), alpha=1.2, beta=10)
+             .astype(np.float32) / 255.0 - 0.5) * 2.0
+
+
+def detection_frame(frame, dst=None):
+    if frame.shape[1::-1] == DETECT_SIZE:
+        return frame
+    return cv2.resize(frame, DETECT_SIZE, dst=dst, interpolation=cv2.INTER_AREA)
+
+
 class EmotionDetector:
-    def __init__(self):
+    """Face detector and emotion classifier, shared by every DetectionSession.
+
+    The classifier runs on a pluggable backend (see emotion_backends): the
+    FER Keras model, or an exported ONNX / TFLite model. Its models are loaded
+    on first use, or earlier by calling load(), so constructing a detector is cheap.
+    """
+
+    def __init__(self, face_detector='haar', emotion_backend='fer', model_path=None):
+        if face_detector not in FACE_DETECTORS:
+            raise ValueError(f"Unknown face detector: {face_detector}")
+        self._local = threading.local()
+        # Only one detector runs per frame; MTCNN comes from FER, so it needs the fer backend
+        self.face_detector = face_detector
+        self.backend = create_emotion_backend(emotion_backend, model_path, mtcnn=(face_detector == 'mtcnn'))
+        self._faces_seen = itertools.count()
+
+    def load(self):
+        if not self.backend.loaded:
+            started = time.perf_counter()
+            self.backend.load()
+            logger.info(f"Loaded {self.backend.name} emotion model ({self.face_detector} faces) "
+                        f"in {time.perf_counter() - started:.2f}s")
+        return self
+
+    @property
+    def loaded(self):
+        return self.backend.loaded
+
+    @property
+    def face_cascade(self):
+        # CascadeClassifier is not safe to share between inference threads
+        cascade = getattr(self._local, 'face_cascade', None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+            self._local.face_cascade = cascade
+        return cascade
+
+    def _scratch(self, name, shape, dtype=np.uint8):
+        # Per-thread arrays reused by every call; batches get the first rows of one that only grows
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape[1:] != tuple(shape[1:]) or len(buffer) < shape[0]:
+            rows = shape[0] if buffer is None else max(shape[0], 2 * len(buffer))
+            buffer = buffers[name] = np.empty((rows,) + tuple(shape[1:]), dtype=dtype)
+        return buffer[:shape[0]]
+
+    def detect_faces(self, small_frame, regions=None):
+        """Return face boxes (x, y, w, h) in small_frame coordinates.
+
+        regions limits the Haar search to (x, y, w, h, min_size, max_size)
+        windows, each scanned only for faces within that size range (see
+        face_search). If a window comes up empty its face moved further than
+        expected, and the whole frame is scanned after all. MTCNN always
+        searches the whole frame.
+        """
+        if self.face_detector == 'mtcnn':
+            return self.backend.find_faces(small_frame)
+        gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY, dst=self._scratch('gray', small_frame.shape[:2]))
+        if regions is None:
+            return self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(30, 30))  # Adjusted for accuracy
+        faces = []
+        for x, y, w, h, min_size, max_size in regions:
+            found = self.face_cascade.detectMultiScale(gray[y:y+h, x:x+w], 1.1, 5, minSize=(min_size, min_size),
+                                                       maxSize=(max_size, max_size))
+            if len(found) == 0:
+                return self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(30, 30))
+            for fx, fy, fw, fh in found:
+                box = (fx + x, fy + y, fw, fh)
+                # Windows of faces close together overlap and may find the same face twice
+                if not faces or box_iou(np.array([box], dtype=float), np.array(faces, dtype=float)).max() < 0.5:
+                    faces.append(box)
+        return faces
+
+    def locate_faces(self, frame, regions=None):
+        """Face boxes of a frame of any resolution, in display coordinates."""
+        s = DISPLAY_SCALE
+        small = detection_frame(frame, self._scratch('small', DETECT_SIZE[::-1] + (3,)))
+        return [(x*s, y*s, w*s, h*s) for (x, y, w, h) in self.detect_faces(small, regions)]
+
+    def crop_faces(self, frame, boxes, out=None):
+        """Model-sized crops of display-coordinate boxes, cut from frame at its own resolution.
+
+        Returns an N x 64 x 64 x 3 stack, written into out when given.
+        """
+        if out is None:
+            out = np.empty((len(boxes),) + FACE_INPUT_SIZE + (3,), dtype=np.uint8)
+        sx = frame.shape[1] / DISPLAY_SIZE[0]
+        sy = frame.shape[0] / DISPLAY_SIZE[1]
+        offsets = (round(FACE_OFFSETS[0] * sx), round(FACE_OFFSETS[1] * sy))
+        for face, (x, y, w, h) in zip(out, boxes):
+            self._crop_face(frame, (int(x * sx), int(y * sy), int(w * sx), int(h * sy)), offsets, face)
+        return out
+
+    def _crop_face(self, frame, box, offsets=FACE_OFFSETS, dst=None):
+        # Square the box and pad it like FER does before resizing to the model input
+        x, y, w, h = box
+        side = max(w, h)
+        x -= (side - w) // 2
+        y -= (side - h) // 2
+        x_off, y_off = offsets
+        x1, y1 = max(0, x - x_off), max(0, y - y_off)
+        x2 = min(frame.shape[1], x + side + x_off)
+        y2 = min(frame.shape[0], y + side + y_off)
+        if x2 <= x1 or y2 <= y1:
+            if dst is None:
+                return np.zeros(FACE_INPUT_SIZE + (3,), dtype=np.uint8)
+            dst[...] = 0
+            return dst
+        return cv2.resize(frame[y1:y2, x1:x2], FACE_INPUT_SIZE, dst=dst)
+
+    @staticmethod
+    def preprocess_faces(faces, out=None, gray=None):
+        """Turn a stack of BGR face crops (N x 64 x 64 x 3) into the classifier input batch.
+
+        out (N x 64 x 64 float32) and gray (N*64 x 64 uint8) are optional arrays to write into.
+        """
+        n, h, w = faces.shape[:3]
+        # One grayscale pass over the whole stack, then one table lookup for contrast and scaling
+        gray = cv2.cvtColor(faces.reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY, dst=gray)
+        if out is None:
+            out = np.empty((n, h, w), dtype=np.float32)
+        cv2.LUT(gray, INPUT_LUT, dst=out.reshape(n * h, w))
+        return out
+
+    def classify_faces(self, faces):
+        """Classify a stack of BGR face crops (N x 64 x 64 x 3) in a single model call.
+
+        Returns an N x 7 array of probabilities ordered like EMOTIONS.
+        """
+        if len(faces) == 0:
+            return np.empty((0, len(EMOTIONS)), dtype=np.float32)
+        if not self.backend.loaded:
+            self.load()
+        n, h, w = faces.shape[:3]
+        batch = self.preprocess_faces(faces, out=self._scratch('batch', (n, h, w), np.float32),
+                                      gray=self._scratch('batch_gray', (n * h, w)))
+        return self.backend.classify(batch)
+
+    def analyze_faces(self, frames, boxes_per_frame, reference=None):
+        """Crop every display-coordinate box of every frame and classify them all in one batch.
+
+        With a reference from FaceResultCache.reference(), faces whose crop
+        barely changed reuse their cached probabilities and only the rest are
+        classified. Returns, per frame, a list of (emotion, probabilities,
+        signature) aligned with its boxes; signature is the crop's cache
+        signature, REUSED when the probabilities came from the cache, and None
+        when there is no reference or classification failed (nothing to cache).
+        """
+        crops = self._scratch('faces', (sum(len(boxes) for boxes in boxes_per_frame),) + FACE_INPUT_SIZE + (3,))
+        start = 0
+        for frame, boxes in zip(frames, boxes_per_frame):
+            self.crop_faces(frame, boxes, out=crops[start:start + len(boxes)])
+            start += len(boxes)
+
+        signatures = [None] * len(crops)
+        reused = [None] * len(crops)
+        if reference is not None and len(crops):
+            signatures = face_signatures(crops)
+            start = 0
+            for boxes in boxes_per_frame:
+                reused[start:start + len(boxes)] = reuse_results(boxes, signatures[start:start + len(boxes)], reference)
+                start += len(boxes)
+        misses = [i for i, cached in enumerate(reused) if cached is None]
+        try:
+            classified = self.classify_faces(crops if len(misses) == len(crops) else crops[misses])
+        except Exception as e:
+            logger.error(f"Emotion analysis error: {e}")
+            classified = np.zeros((len(misses), len(EMOTIONS)), dtype=np.float32)
+            classified[:, EMOTIONS.index("neutral")] = 1.0
+            signatures = [None] * len(crops)  # The neutral stand-ins must never be cached
+        probs = list(reused)
+        for i, p in zip(misses, classified):
+            probs[i] = p
+
+        results = []
+        start = 0
+        for boxes in boxes_per_frame:
+            frame_results = []
+            for i in range(start, start + len(boxes)):
+                p = probs[i]
+                emotion = EMOTIONS[int(np.argmax(p))]
+                if logger.isEnabledFor(logging.DEBUG) and next(self._faces_seen) % FACE_LOG_SAMPLE == 0:
+                    logger.debug(f"Emotions detected: { {e: round(float(s), 2) for e, s in zip(EMOTIONS, p)} }")
+                frame_results.append((emotion, p, REUSED if reused[i] is not None else signatures[i]))
+            results.append(frame_results)
+            start += len(boxes)
+        return results
+
+    def analyze_frames(self, frames, timings=None, regions=None, reference=None):
+        """Detect and classify the faces of frames of any resolution, batching all faces together.
+
+        Faces are searched for in a 320x240 copy of each frame (only inside
+        regions, when given) and cropped from the frame itself. Returns, per
+        frame, the face boxes in 640x480 display coordinates and their
+        (emotion, probabilities, signature) as in analyze_faces. Stage
+        durations in seconds are stored in timings.
+        """
+        started = time.perf_counter()
+        boxes_per_frame = [self.locate_faces(frame, regions) for frame in frames]
+        detected = time.perf_counter()
+        results = self.analyze_faces(frames, boxes_per_frame, reference)
+        if timings is not None:
+            timings['detect'] = detected - started
+            timings['classify'] = time.perf_counter() - detected
+        return list(zip(boxes_per_frame, results))
+
+
+class DetectionSession:
+    """Webcam loop and tracking/aggregation state of one logged-in user.
+
+    Inference runs on the shared inference pool so sessions never block each other.
+    """
+
+    def __init__(self, inference, user_id, process_workers=1, detect_interval=1, log_writer=None,
+                 on_stop=None, camera_source=0, full_scan_interval=5, result_cache_threshold=0.03,
+                 result_cache_ttl=2.0):
+        self.inference = inference
+        self.camera_source = camera_source  # Camera index, stream URL or video file (files loop)
+        self.log_writer = log_writer
+        self.on_stop = on_stop  # Called with (user_id, session_id) once a session's data is stored
+        self.user_id = user_id
         self.cap = None
         self.is_running = False
         self.lock = threading.Lock()
         self.emotion_summary = {"total_faces": 0, "emotions": {}}
-        self.face_tracker = {}
-        self.frame_queue = queue.Queue(maxsize=3)
-        self.processed_frame = None
-        self.tracking_threshold = 50  # Reduced for better tracking
+        self.face_tracker = {}  # Faces visible in the latest frame: {id: (centroid, emotion, box)}
+        self.tracker = FaceTracker(EMOTIONS, max_distance=50, max_age=10, smoothing=0.3)
+        self.stats = SessionStats(EMOTIONS)
+        # Captured frames are pool arrays, reused once the buffer, processing and viewers are done with them
+        self.frame_pool = FramePool()
+        self.frame_buffer = FrameRingBuffer(capacity=3, release=self.frame_pool.release)
+        self.process_workers = process_workers  # Concurrent processing threads per session
+        self.track_lock = threading.Lock()
+        self.last_applied_sequence = 0
+        # Tracking mode: full detection every detect_interval frames, optical flow in between
+        self.detect_interval = detect_interval
+        self.min_track_confidence = 0.5
+        self.propagator = OpticalFlowPropagator()
+        self.propagation_lock = threading.Lock()
+        self.frames_since_detection = 0
+        # Tracking keeps the previous grayscale frame, so two alternate
+        self.track_small = np.empty(DETECT_SIZE[::-1] + (3,), dtype=np.uint8)
+        self.track_grays = [np.empty(DETECT_SIZE[::-1], dtype=np.uint8) for _ in range(2)]
+        self.face_search = AdaptiveFaceSearch(DETECT_SIZE, full_scan_interval=full_scan_interval)
+        self.search_lock = threading.Lock()
+        # Faces whose crop barely changed since they were classified keep their last probabilities
+        self.result_cache = FaceResultCache(threshold=result_cache_threshold, ttl=result_cache_ttl)
+        self.cache_lock = threading.Lock()
+        self.broadcaster = FrameBroadcaster(quality=85, pool=self.frame_pool)  # Higher quality
         self.frame_counter = 0
+        self.max_batch_frames = 3  # Queued frames classified together in one batch
         self.session_id = None
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        self.emotion_detector = FER(mtcnn=True)  # Use MTCNN for better accuracy
+        self.capture_thread = None
+        self.process_threads = []
 
-    def _analyze_emotion(self, face_roi):
-        try:
-            # Preprocess: Convert to RGB, enhance contrast
-            face_roi_rgb = cv2.cvtColor(face_roi, cv2.COLOR_BGR2RGB)
-            face_roi_rgb = cv2.convertScaleAbs(face_roi_rgb, alpha=1.2, beta=10)
-            result = self.emotion_detector.detect_emotions(face_roi_rgb)
-            if result and len(result) > 0:
-                emotions = result[0]['emotions']
-                dominant_emotion = max(emotions, key=emotions.get)
-                logger.info(f"Emotions detected: {emotions}")
-                return dominant_emotion
-            return "neutral"
-        except Exception as e:
-            logger.error(f"Emotion analysis error: {e}")
-            return "neutral"
+    def _detect(self, frames):
+        # Full-frame scans only every few frames; otherwise just around the faces already found
+        with self.search_lock:
+            regions = self.face_search.plan()
+        with self.cache_lock:
+            reference = self.result_cache.reference()
+        analyzed = self.inference.submit(frames, regions, reference).result()
+        s = DISPLAY_SCALE
+        with self.search_lock:
+            for boxes, _ in analyzed:
+                self.face_search.update([(x//s, y//s, w//s, h//s) for (x, y, w, h) in boxes], regions)
+        return analyzed
+
+    def _analyze_tracked(self, frame):
+        gray = self.track_grays[self.propagator.prev_gray is self.track_grays[0]]
+        cv2.cvtColor(detection_frame(frame, self.track_small), cv2.COLOR_BGR2GRAY, dst=gray)
+        if self.propagator.prev_gray is not None and self.frames_since_detection + 1 < self.detect_interval:
+            boxes, confidences = self.propagator.propagate(gray)
+            if all(c >= self.min_track_confidence for c in confidences):
+                # Not classified this frame: each track carries its emotion forward
+                self.frames_since_detection += 1
+                s = DISPLAY_SCALE
+                return [(x*s, y*s, w*s, h*s) for (x, y, w, h) in boxes], [None] * len(boxes), [None] * len(boxes)
+
+        # Interval reached or a track was lost: run detection + classification
+        boxes, results = self._detect([frame])[0]
+        s = DISPLAY_SCALE
+        self.propagator.reset(gray, [(x//s, y//s, w//s, h//s) for (x, y, w, h) in boxes])
+        self.frames_since_detection = 0
+        return boxes, [probs for _, probs, _ in results], [signature for _, _, signature in results]
+
+    def _analyze(self, frames):
+        """Face boxes, probability vectors (None when not classified) and cache signatures for each frame, in order."""
+        if self.detect_interval <= 1:
+            return [(boxes, [probs for _, probs, _ in results], [signature for _, _, signature in results])
+                    for boxes, results in self._detect(frames)]
+        # Propagation depends on the previous frame, so tracked frames go one at a time
+        with self.propagation_lock:
+            return [self._analyze_tracked(frame) for frame in frames]
+
+    def _track_faces(self, faces, probs, signatures=None):
+        new_tracker = self.tracker.update(faces, probs)
+        FACES_TRACKED.inc(len(faces))
+        if signatures is not None:
+            self._cache_results(new_tracker, faces, probs, signatures)
+        self.stats.update(new_tracker)
+        if self.log_writer and self.session_id:
+            now = time.time()
+            for fid, (_, emotion, _) in new_tracker.items():
+                self.log_writer.log(self.session_id, fid, emotion, self.tracker.confidences[fid], now)
+
+        self.face_tracker = new_tracker
+        emotion_counts = Counter(emotion for _, emotion, _ in new_tracker.values())
+        self.emotion_summary = {
+            "total_faces": len(faces),
+            "emotions": dict(emotion_counts) if emotion_counts else {"neutral": 0},
+            "session": self.stats.summary(),
+        }
+        return new_tracker
+
+    def _cache_results(self, tracker, faces, probs, signatures):
+        by_box = {box: fid for fid, (_, _, box) in tracker.items()}
+        classified = {}
+        for box, p, signature in zip(faces, probs, signatures):
+            fid = by_box.get(tuple(int(v) for v in box))
+            if fid is not None and p is not None:
+                classified[fid] = (box, p, signature)
+        with self.cache_lock:
+            self.result_cache.update(classified)
 
     def start_session(self):
         with self.lock:
             if self.is_running:
                 return False
             
-            self.cap = cv2.VideoCapture(0)
+            self.cap = cv2.VideoCapture(self.camera_source)
             if not self.cap.isOpened():
                 logger.error("Error: Webcam not accessible!")
                 return False
@@ -58,36 +385,47 @@ class EmotionDetector:
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
             self.cap.set(cv2.CAP_PROP_FPS, 15)  # Lower FPS to reduce lag
             self.is_running = True
+            self.broadcaster.open()
 
-            conn = get_db_connection()
-            if conn:
-                try:
-                    with conn.cursor() as cursor:
-                        cursor.execute('''
-                            INSERT INTO sessions (user_id, start_time)
-                            VALUES (%s, NOW())
-                        ''', (session.get('user_id'),))
-                        self.session_id = cursor.lastrowid
-                        cursor.execute('''
-                            UPDATE dashboard_stats 
-                            SET total_sessions = total_sessions + 1
-                            WHERE id = 1
-                        ''')
-                        conn.commit()
-                    logger.info(f"Session started with ID: {self.session_id}")
-                except Exception as e:
-                    logger.error(f"Database error: {e}")
-                    self.session_id = None
-                finally:
-                    conn.close()
-            else:
-                self.is_running = False
-                return False
+            with db_connection() as conn:
+                if conn:
+                    try:
+                        with conn.cursor() as cursor:
+                            cursor.execute('''
+                                INSERT INTO sessions (user_id, start_time)
+                                VALUES (%s, NOW())
+                            ''', (self.user_id,))
+                            self.session_id = cursor.lastrowid
+                            cursor.execute('''
+                                UPDATE dashboard_stats 
+                                SET total_sessions = total_sessions + 1
+                                WHERE id = 1
+                            ''')
+                            conn.commit()
+                        logger.info(f"Session started with ID: {self.session_id}")
+                    except Exception as e:
+                        logger.error(f"Database error: {e}")
+                        self.session_id = None
+                else:
+                    self.is_running = False
+                    self.broadcaster.close()
+                    return False
 
+            self.frame_buffer.open()
+            self.last_applied_sequence = 0
+            self.propagator.reset(None, [])
+            self.face_search.reset()
+            with self.track_lock:
+                with self.cache_lock:
+                    self.result_cache.reset()
+                self.tracker.reset()
+                self.stats.reset()
             self.capture_thread = threading.Thread(target=self._capture_frames, daemon=True)
-            self.process_thread = threading.Thread(target=self._process_frames, daemon=True)
+            self.process_threads = [threading.Thread(target=self._process_frames, daemon=True)
+                                    for _ in range(self.process_workers)]
             self.capture_thread.start()
-            self.process_thread.start()
+            for thread in self.process_threads:
+                thread.start()
             return True
 
     def stop_session(self):
@@ -96,174 +434,169 @@ class EmotionDetector:
                 return
             
             self.is_running = False
+            self.broadcaster.close()
+            self.frame_buffer.close()
+            if self.capture_thread:
+                self.capture_thread.join(timeout=5)
+            for thread in self.process_threads:
+                thread.join(timeout=5)
             if self.cap and self.cap.isOpened():
                 self.cap.release()
                 self.cap = None
 
-            if self.capture_thread:
-                self.capture_thread.join(timeout=5)
-            if self.process_thread:
-                self.process_thread.join(timeout=5)
+            # Per-frame events were streamed while running; make sure they are all stored
+            if self.log_writer:
+                self.log_writer.flush()
 
-            conn = get_db_connection()
-            if conn and self.session_id:
-                try:
-                    with conn.cursor() as cursor:
-                        for fid, (_, emotion, _) in self.face_tracker.items():
-                            if emotion:
-                                cursor.execute('''
-                                    INSERT INTO emotion_logs (session_id, emotion)
-                                    VALUES (%s, %s)
-                                ''', (self.session_id, emotion))
-                        
-                        cursor.execute('''
-                            UPDATE sessions SET
-                                end_time = NOW(),
-                                total_faces = %s,
-                                most_common_emotion = %s
-                            WHERE id = %s
-                        ''', (self.emotion_summary['total_faces'],
-                              max(self.emotion_summary['emotions'], key=self.emotion_summary['emotions'].get, default='neutral'),
-                              self.session_id))
+            with db_connection() as conn:
+                if conn and self.session_id:
+                    try:
+                        with conn.cursor() as cursor:
+                            cursor.execute('''
+                                UPDATE sessions SET
+                                    end_time = NOW(),
+                                    total_faces = %s,
+                                    most_common_emotion = %s
+                                WHERE id = %s
+                            ''', (self.stats.unique_faces,
+                                  self.stats.most_common_emotion(),
+                                  self.session_id))
                         
-                        cursor.execute('''
-                            UPDATE dashboard_stats SET
-                                total_faces_detected = total_faces_detected + %s,
-                                most_common_emotion = COALESCE(
-                                    (SELECT emotion 
-                                     FROM emotion_logs 
-                                     GROUP BY emotion 
-                                     ORDER BY COUNT(*) DESC 
-                                     LIMIT 1),
-                                    most_common_emotion
-                                ),
-                                last_updated = NOW()
-                            WHERE id = 1
-                        ''', (self.emotion_summary['total_faces'],))
+                            cursor.execute('''
+                                UPDATE dashboard_stats SET
+                                    total_faces_detected = total_faces_detected + %s,
+                                    most_common_emotion = COALESCE(
+                                        (SELECT emotion 
+                                         FROM global_emotion_counts 
+                                         ORDER BY count DESC 
+                                         LIMIT 1),
+                                        most_common_emotion
+                                    ),
+                                    last_updated = NOW()
+                                WHERE id = 1
+                            ''', (self.stats.unique_faces,))
                         
-                        conn.commit()
-                    logger.info(f"Session {self.session_id} stopped and logged")
-                except Exception as e:
-                    logger.error(f"Database error: {e}")
-                finally:
-                    conn.close()
+                            conn.commit()
+                        logger.info(f"Session {self.session_id} stopped and logged")
+                    except Exception as e:
+                        logger.error(f"Database error: {e}")
+            if self.on_stop and self.session_id:
+                self.on_stop(self.user_id, self.session_id)
 
-            self.face_tracker = {}
-            self.emotion_summary = {"total_faces": 0, "emotions": {}}
+            with self.track_lock:
+                self.face_tracker = {}
+                self.tracker.reset()
+                self.emotion_summary = {"total_faces": 0, "emotions": {}}
             self.session_id = None
 
     def _capture_frames(self):
+        # cap.read() blocks until the camera delivers, so no sleep is needed
+        # for cameras; video files are looped and read at their own frame rate
+        from_file = isinstance(self.camera_source, str) and os.path.isfile(self.camera_source)
+        interval = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 15) if from_file else 0.0
+        next_frame = time.monotonic()
+        shape = DISPLAY_SIZE[::-1] + (3,)  # What the camera was asked for
         while self.is_running:
             try:
-                ret, frame = self.cap.read()
-                if ret and not self.frame_queue.full():
-                    self.frame_queue.put(cv2.resize(frame, (320, 240)))
-                time.sleep(0.05)  # Reduced frequency
+                if interval:
+                    next_frame = max(next_frame + interval, time.monotonic() - interval)
+                    time.sleep(max(0.0, next_frame - time.monotonic()))
+                started = time.perf_counter()
+                # Decode straight into a reused array; OpenCV allocates a new one if the size differs
+                buffer = self.frame_pool.acquire(shape)
+                ret, frame = self.cap.read(buffer)
+                if frame is not buffer:
+                    self.frame_pool.release(buffer)
+                    if ret:
+                        shape = frame.shape
+                if not ret:
+                    if from_file:
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                # Frames stay at capture resolution so faces are cropped from full detail
+                self.frame_buffer.put(frame)
+                observe_stage('capture', time.perf_counter() - started)
+                FRAMES_CAPTURED.inc()
             except Exception as e:
                 logger.error(f"Capture frame error: {e}")
                 break
 
+    def _annotate(self, frame, tracker):
+        if frame.shape[1::-1] != DISPLAY_SIZE:
+            resized = self.frame_pool.acquire(DISPLAY_SIZE[::-1] + frame.shape[2:])
+            cv2.resize(frame, DISPLAY_SIZE, dst=resized)
+            self.frame_pool.release(frame)
+            frame = resized
+        for fid, (_, emotion, (x, y, w, h)) in tracker.items():
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            cv2.putText(frame, f"{emotion} (ID: {fid})", (x, y-10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        return frame
+
     def _process_frames(self):
         while self.is_running:
             try:
-                if self.frame_queue.empty():
-                    time.sleep(0.05)
+                # Take everything already buffered so all its faces share one model call
+                batch = self.frame_buffer.get_batch(self.max_batch_frames, timeout=0.5)
+                if not batch:
                     continue
+                self.frame_counter += len(batch)
+                FRAMES_PROCESSED.labels('camera').inc(len(batch))
 
-                small_frame = self.frame_queue.get()
-                self.frame_counter += 1
-                
-                gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
-                faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(30, 30))  # Adjusted for accuracy
-                
-                frame = cv2.resize(small_frame, (640, 480))
-                current_emotions = []
-                new_tracker = {}
-
-                for (x, y, w, h) in faces:
-                    x *= 2; y *= 2; w *= 2; h *= 2
-                    face_roi = frame[y:y+h, x:x+w]
-                    emotion = self._analyze_emotion(face_roi)
-                    
-                    centroid = (x + w//2, y + h//2)
-                    closest_id = None
-                    min_dist = float('inf')
-                    
-                    for fid, (old_cent, _, _) in self.face_tracker.items():
-                        dist = ((centroid[0]-old_cent[0])**2 + (centroid[1]-old_cent[1])**2)**0.5
-                        if dist < min_dist and dist < self.tracking_threshold:
-                            min_dist = dist
-                            closest_id = fid
-                    
-                    fid = closest_id if closest_id else len(self.face_tracker)
-                    new_tracker[fid] = (centroid, emotion, (x, y, w, h))
-                    current_emotions.append(emotion)
-                    
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                    cv2.putText(frame, f"{emotion} (ID: {fid})", (x, y-10), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                self.face_tracker = new_tracker
-                emotion_counts = {e: current_emotions.count(e) for e in set(current_emotions)}
-                self.emotion_summary = {
-                    "total_faces": len(faces),
-                    "emotions": emotion_counts if emotion_counts else {"neutral": 0}
-                }
-                
-                self.processed_frame = frame
+                # Every frame goes back to the pool except the one handed on to the broadcaster
+                frames = [frame for _, frame in batch]
+                try:
+                    analyzed = self._analyze(frames)
+                    with self.track_lock:
+                        # With several processing threads a slower batch may finish after a newer one
+                        if batch[-1][0] < self.last_applied_sequence:
+                            continue
+                        self.last_applied_sequence = batch[-1][0]
+                        for frame, (boxes, probs, signatures) in zip(frames, analyzed):
+                            tracker = self._track_faces(boxes, probs, signatures)
+                        started = time.perf_counter()
+                        frame = self._annotate(frames.pop(), tracker)
+                        observe_stage('annotate', time.perf_counter() - started)
+                finally:
+                    for unused in frames:
+                        self.frame_pool.release(unused)
+
+                self.broadcaster.publish(frame)
             except Exception as e:
                 logger.error(f"Process frame error: {e}")
                 break
 
     def generate_frames(self):
-        while self.is_running:
-            try:
-                if self.processed_frame is not None:
-                    ret, buffer = cv2.imencode('.jpg', self.processed_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85])  # Higher quality
-                    frame_data = (b'--frame\r\n'
-                                 b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-                    yield frame_data
-                time.sleep(0.05)
-            except Exception as e:
-                logger.error(f"Generate frames error: {e}")
-                break
+        # Every viewer shares the broadcaster's single JPEG encode per new frame
+        try:
+            yield from self.broadcaster.subscribe()
+        except Exception as e:
+            logger.error(f"Generate frames error: {e}")
+
+    async def generate_frames_async(self):
+        # For ASGI servers: viewers wait on the event loop instead of each holding a worker thread
+        try:
+            async for chunk in self.broadcaster.subscribe_async():
+                yield chunk
+        except Exception as e:
+            logger.error(f"Generate frames error: {e}")
 
     def process_client_frame(self, frame):
+        return self.process_client_frames([frame])[0]
+
+    def process_client_frames(self, frames):
+        """Track and summarize browser frames in order, classifying them in batches."""
+        summaries = []
         try:
-            small_frame = cv2.resize(frame, (320, 240))
-            gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(30, 30))
-            
-            frame_resized = cv2.resize(small_frame, (640, 480))
-            current_emotions = []
-            new_tracker = {}
-
-            for (x, y, w, h) in faces:
-                x *= 2; y *= 2; w *= 2; h *= 2
-                face_roi = frame_resized[y:y+h, x:x+w]
-                emotion = self._analyze_emotion(face_roi)
-                
-                centroid = (x + w//2, y + h//2)
-                closest_id = None
-                min_dist = float('inf')
-                
-                for fid, (old_cent, _, _) in self.face_tracker.items():
-                    dist = ((centroid[0]-old_cent[0])**2 + (centroid[1]-old_cent[1])**2)**0.5
-                    if dist < min_dist and dist < self.tracking_threshold:
-                        min_dist = dist
-                        closest_id = fid
-                
-                fid = closest_id if closest_id else len(self.face_tracker)
-                new_tracker[fid] = (centroid, emotion, (x, y, w, h))
-                current_emotions.append(emotion)
-
-            self.face_tracker = new_tracker
-            emotion_counts = {e: current_emotions.count(e) for e in set(current_emotions)}
-            self.emotion_summary = {
-                "total_faces": len(faces),
-                "emotions": emotion_counts if emotion_counts else {"neutral": 0}
-            }
-            return self.emotion_summary
+            for start in range(0, len(frames), self.max_batch_frames):
+                chunk = frames[start:start + self.max_batch_frames]
+                for boxes, probs, signatures in self._analyze(chunk):
+                    # Other requests of this user and the camera loop update the same tracker
+                    with self.track_lock:
+                        self._track_faces(boxes, probs, signatures)
+                        summaries.append(self.emotion_summary)
+                FRAMES_PROCESSED.labels('client').inc(len(chunk))
         except Exception as e:
             logger.error(f"Client frame processing error: {e}")
-            return {"total_faces": 0, "emotions": {"neutral": 0}}
\ No newline at end of file
+        summaries.extend({"total_faces": 0, "emotions": {"neutral": 0}} for _ in frames[len(summaries):])
+        return summaries
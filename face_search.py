@@ -0,0 +1,54 @@
+import math
+
+
+class AdaptiveFaceSearch:
+    """Decides which parts of the next frames the face detector scans.
+
+    The whole frame is scanned every full_scan_interval frames, and whenever
+    there is no face to follow or a followed face went missing. In between,
+    only a window around each last known face is scanned, padded by margin
+    times the face size, and only for face sizes within scale_range of it.
+    Boxes and regions are in detection-frame coordinates.
+    """
+
+    def __init__(self, frame_size=(320, 240), full_scan_interval=5, margin=0.5, scale_range=(0.75, 1.35),
+                 min_size=30):
+        self.frame_size = frame_size
+        self.full_scan_interval = full_scan_interval
+        self.margin = margin
+        self.scale_range = scale_range
+        self.min_size = min_size
+        self.reset()
+
+    def reset(self):
+        self.boxes = []
+        self.frames_since_full_scan = None  # None forces a full scan
+
+    def plan(self):
+        """Regions (x, y, w, h, min_size, max_size) to scan in the next frames, or None for the whole frame."""
+        if (not self.boxes or self.frames_since_full_scan is None
+                or self.frames_since_full_scan + 1 >= self.full_scan_interval):
+            return None
+        width, height = self.frame_size
+        regions = []
+        for x, y, w, h in self.boxes:
+            size = max(w, h)
+            min_size = max(self.min_size, int(size * self.scale_range[0]))
+            max_size = max(min_size, math.ceil(size * self.scale_range[1]))
+            half = max_size / 2 + size * self.margin
+            cx, cy = x + w / 2, y + h / 2
+            x1, y1 = max(0, int(cx - half)), max(0, int(cy - half))
+            x2, y2 = min(width, math.ceil(cx + half)), min(height, math.ceil(cy + half))
+            if x2 - x1 >= min_size and y2 - y1 >= min_size:
+                regions.append((x1, y1, x2 - x1, y2 - y1, min_size, max_size))
+        return regions or None
+
+    def update(self, boxes, regions):
+        """Record the faces found in one frame that was scanned with regions (as returned by plan())."""
+        if regions is None:
+            self.frames_since_full_scan = 0
+        elif self.frames_since_full_scan is not None and len(boxes) >= len(self.boxes):
+            self.frames_since_full_scan += 1
+        else:
+            self.frames_since_full_scan = None
+        self.boxes = [tuple(int(v) for v in box) for box in boxes]
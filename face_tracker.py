@@ -0,0 +1,167 @@
+import numpy as np
+
+GATED_COST = 1e9
+
+_linear_sum_assignment = None
+
+
+def _hungarian(cost):
+    """Minimum-cost assignment for a rectangular cost matrix (shortest augmenting paths).
+
+    Returns (row_indices, col_indices) like scipy.optimize.linear_sum_assignment.
+    """
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_col = np.zeros(m + 1, dtype=int)  # 1-based row assigned to each column, 0 = free
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        row_of_col[0] = i
+        j0 = 0
+        min_v = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of_col[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < min_v[1:])
+            min_v[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_v[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[row_of_col[used]] += delta
+            v[used] -= delta
+            min_v[1:][free] -= delta
+            j0 = j1
+            if row_of_col[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            row_of_col[j0] = row_of_col[j1]
+            j0 = j1
+    cols = np.nonzero(row_of_col[1:])[0]
+    rows = row_of_col[1:][cols] - 1
+    order = np.argsort(rows)
+    rows, cols = rows[order], cols[order]
+    return (cols, rows) if transposed else (rows, cols)
+
+
+def _assign(cost):
+    global _linear_sum_assignment
+    if _linear_sum_assignment is None:
+        # Imported on first use: scipy.optimize takes a noticeable part of app startup
+        try:
+            from scipy.optimize import linear_sum_assignment
+        except ImportError:  # scipy is optional; fall back to the NumPy solver above
+            linear_sum_assignment = _hungarian
+        _linear_sum_assignment = linear_sum_assignment
+    return _linear_sum_assignment(cost)
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) / (M, 4) arrays of (x, y, w, h) boxes."""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    x1 = np.maximum(a[..., 0], b[..., 0])
+    y1 = np.maximum(a[..., 1], b[..., 1])
+    x2 = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    y2 = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class FaceTracker:
+    """Assigns stable IDs to face boxes across frames and smooths their emotions.
+
+    Detections are matched to live tracks by optimal assignment over a
+    centroid-distance matrix. Pairs further apart than max_distance or
+    overlapping less than min_iou are never matched. Tracks survive up to
+    max_age frames without a match, and new tracks get monotonically
+    increasing IDs. Each track keeps an exponential moving average of its
+    probability vectors, and its label is the argmax of that average.
+    """
+
+    def __init__(self, labels, max_distance=50, min_iou=0.1, max_age=10, smoothing=0.3,
+                 default_label='neutral'):
+        self.labels = list(labels)
+        self.max_distance = max_distance
+        self.min_iou = min_iou
+        self.max_age = max_age
+        self.smoothing = smoothing  # Weight of the newest probabilities in the average
+        self.default_probs = np.zeros(len(self.labels), dtype=np.float32)
+        self.default_probs[self.labels.index(default_label)] = 1.0
+        self.reset()
+
+    def reset(self):
+        self.next_id = 0
+        self.ids = np.empty(0, dtype=int)
+        self.boxes = np.empty((0, 4), dtype=float)
+        self.ages = np.empty(0, dtype=int)
+        self.probs = np.empty((0, len(self.labels)), dtype=np.float32)
+        self.confidences = {}  # Smoothed probability of each visible face's label
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, boxes, probs):
+        """Match this frame's boxes to tracks and fold in their probability vectors.
+
+        A None entry in probs means the box was not classified this frame (e.g.
+        propagated by optical flow) and keeps its track's average unchanged.
+        Returns {track_id: (centroid, emotion, box)} for the faces seen in this frame.
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        track_for_box = np.full(len(boxes), -1)
+
+        if len(boxes) and len(self.ids):
+            centroids = boxes[:, :2] + boxes[:, 2:] / 2
+            track_centroids = self.boxes[:, :2] + self.boxes[:, 2:] / 2
+            distance = np.linalg.norm(centroids[:, None, :] - track_centroids[None, :, :], axis=-1)
+            gated = (distance > self.max_distance) | (box_iou(boxes, self.boxes) < self.min_iou)
+            rows, cols = _assign(np.where(gated, GATED_COST, distance))
+            keep = ~gated[rows, cols]
+            track_for_box[rows[keep]] = cols[keep]
+
+        matched = np.zeros(len(self.ids), dtype=bool)
+        matched[track_for_box[track_for_box >= 0]] = True
+        self.ages[~matched] += 1
+        probs = list(probs)
+        for box_index, track_index in enumerate(track_for_box):
+            if track_index >= 0:
+                self.boxes[track_index] = boxes[box_index]
+                self.ages[track_index] = 0
+                if probs[box_index] is not None:
+                    self.probs[track_index] += self.smoothing * (probs[box_index] - self.probs[track_index])
+
+        new = track_for_box < 0
+        new_ids = np.arange(self.next_id, self.next_id + int(new.sum()))
+        self.next_id += len(new_ids)
+        track_for_box[new] = np.arange(len(self.ids), len(self.ids) + len(new_ids))
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.boxes = np.concatenate([self.boxes, boxes[new]])
+        self.ages = np.concatenate([self.ages, np.zeros(len(new_ids), dtype=int)])
+        new_probs = [self.default_probs if probs[i] is None else probs[i] for i in np.nonzero(new)[0]]
+        if new_probs:
+            self.probs = np.concatenate([self.probs, np.asarray(new_probs, dtype=np.float32)])
+
+        labels = np.argmax(self.probs, axis=1) if len(self.probs) else []
+        visible = {}
+        confidences = {}
+        for box_index, track_index in enumerate(track_for_box):
+            x, y, w, h = (int(v) for v in boxes[box_index])
+            track_id = int(self.ids[track_index])
+            visible[track_id] = ((x + w//2, y + h//2), self.labels[labels[track_index]], (x, y, w, h))
+            confidences[track_id] = float(self.probs[track_index, labels[track_index]])
+        self.confidences = confidences
+
+        alive = self.ages <= self.max_age
+        if not alive.all():
+            self.ids, self.boxes = self.ids[alive], self.boxes[alive]
+            self.ages, self.probs = self.ages[alive], self.probs[alive]
+        return visible
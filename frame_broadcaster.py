@@ -0,0 +1,147 @@
+import time
+import asyncio
+import threading
+import cv2
+from metrics import observe_stage
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+MJPEG_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+class FrameBroadcaster:
+    """Fans the latest processed frame out to any number of MJPEG viewers.
+
+    Each published frame gets a sequence number and is JPEG-encoded at most
+    once, by whichever viewer asks for it first, so the encoding cost does not
+    grow with the number of viewers and nothing is encoded while nobody
+    watches. Viewers block on a condition until a newer frame exists, or
+    with subscribe_async() await one without holding a thread.
+    With a FramePool, published frames are pool frames the broadcaster
+    holds until a newer one replaces them and nobody is encoding them.
+    """
+
+    def __init__(self, quality=85, pool=None):
+        self.quality = quality
+        self.pool = pool
+        self.condition = threading.Condition()
+        self.encode_lock = threading.Lock()
+        self.sequence = 0
+        self.frame = None
+        self.encoded_sequence = 0
+        self.encoded_chunk = None
+        self.closed = True
+        self.async_waiters = {}  # Event loop -> future resolved on the next publish or close
+
+    def open(self):
+        with self.condition:
+            self.closed = False
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            frame, self.frame = self.frame, None
+            self.condition.notify_all()
+            self._notify_async()
+        self._release(frame)
+
+    def publish(self, frame):
+        with self.condition:
+            if self.closed:
+                # A processing thread finishing its last batch after the session stopped
+                previous = frame
+            else:
+                previous, self.frame = self.frame, frame
+                self.sequence += 1
+                self.condition.notify_all()
+                self._notify_async()
+        self._release(previous)
+
+    def _notify_async(self):
+        # Called with the condition held; one wake-up per event loop, however many viewers wait on it
+        for loop, future in self.async_waiters.items():
+            loop.call_soon_threadsafe(_wake, future)
+        self.async_waiters = {}
+
+    def _release(self, frame):
+        if self.pool is not None and frame is not None:
+            self.pool.release(frame)
+
+    def _encode(self, sequence, frame):
+        # A viewer that fell behind may get an even newer chunk encoded by someone else
+        with self.encode_lock:
+            if self.encoded_sequence < sequence:
+                started = time.perf_counter()
+                ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+                if not ret:
+                    return sequence, None
+                # One copy of the encoder's buffer straight into the chunk every viewer shares
+                self.encoded_chunk = b''.join((MJPEG_HEADER, memoryview(buffer), b'\r\n'))
+                self.encoded_sequence = sequence
+                observe_stage('encode', time.perf_counter() - started)
+            return self.encoded_sequence, self.encoded_chunk
+
+    def _encode_held(self, sequence, frame):
+        # Runs on an executor thread and releases there, so a viewer cancelled meanwhile cannot free the frame mid-encode
+        try:
+            return self._encode(sequence, frame)
+        finally:
+            self._release(frame)
+
+    def subscribe(self, idle_timeout=5.0):
+        """Yield multipart MJPEG chunks, one per new frame, until the broadcaster closes."""
+        last_sequence = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.closed or (self.frame is not None and self.sequence != last_sequence),
+                    timeout=idle_timeout,
+                )
+                if self.closed:
+                    return
+                if self.frame is None or self.sequence == last_sequence:
+                    continue
+                last_sequence, frame = self.sequence, self.frame
+                if self.pool is not None:
+                    self.pool.retain(frame)  # Still being encoded if publish() replaces it meanwhile
+            try:
+                last_sequence, chunk = self._encode(last_sequence, frame)
+            finally:
+                self._release(frame)
+            if chunk is not None:
+                yield chunk
+
+    async def subscribe_async(self, idle_timeout=5.0):
+        """subscribe() as an async generator: waits on the event loop, encodes on its default executor."""
+        loop = asyncio.get_running_loop()
+        last_sequence = 0
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                if self.frame is None or self.sequence == last_sequence:
+                    future = self.async_waiters.get(loop)
+                    if future is None:
+                        future = self.async_waiters[loop] = loop.create_future()
+                else:
+                    future = None
+                    last_sequence, frame = self.sequence, self.frame
+                    if self.pool is not None:
+                        self.pool.retain(frame)
+            if future is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), idle_timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self.encoded_sequence >= last_sequence:
+                # Another viewer already encoded this frame or a newer one
+                last_sequence, chunk = self.encoded_sequence, self.encoded_chunk
+                self._release(frame)
+            else:
+                last_sequence, chunk = await loop.run_in_executor(None, self._encode_held, last_sequence, frame)
+            if chunk is not None:
+                yield chunk
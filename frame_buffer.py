@@ -0,0 +1,62 @@
+import collections
+import threading
+from metrics import FRAMES_DROPPED
+
+
+class FrameRingBuffer:
+    """Bounded frame buffer where the newest frame always wins.
+
+    Putting into a full buffer evicts the oldest frame instead of rejecting
+    the new one, and consumers block on a condition rather than polling.
+    Frames are handed out with an increasing sequence number. release, when
+    given, is called with every frame the buffer discards (see FramePool).
+    """
+
+    def __init__(self, capacity=3, release=None):
+        self.frames = collections.deque(maxlen=capacity)
+        self.release = release
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.dropped = 0
+        self.closed = False
+
+    def open(self):
+        with self.condition:
+            self._discard(list(self.frames))
+            self.frames.clear()
+            self.closed = False
+
+    def _discard(self, frames):
+        if self.release:
+            for _, frame in frames:
+                self.release(frame)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def put(self, frame):
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+                self._discard([self.frames[0]])
+            self.sequence += 1
+            self.frames.append((self.sequence, frame))
+            self.condition.notify()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get_batch(self, max_items, timeout=None):
+        """Block until frames are available, then take up to max_items oldest-first.
+
+        Returns a list of (sequence, frame); empty on timeout or once closed.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frames or self.closed, timeout=timeout)
+            if self.closed:
+                return []
+            count = min(max_items, len(self.frames))
+            return [self.frames.popleft() for _ in range(count)]
@@ -0,0 +1,185 @@
+import os
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from metrics import observe_stages
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKENDS = ('thread', 'process')
+MAX_FRAME_SHAPE = (480, 640, 3)  # Largest frame a process worker receives; bigger ones are scaled down
+
+
+class ThreadInferencePool:
+    """Runs EmotionDetector.analyze_frames on a bounded pool of threads in this process."""
+
+    def __init__(self, detector, workers=4):
+        self.detector = detector
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+
+    def _analyze(self, frames, regions, reference):
+        timings = {}
+        results = self.detector.analyze_frames(frames, timings, regions, reference)
+        observe_stages(timings)
+        return results
+
+    def submit(self, frames, regions=None, reference=None):
+        return self.executor.submit(self._analyze, frames, regions, reference)
+
+    def warm_up(self):
+        self.detector.load()
+
+    def ready(self):
+        return self.detector.loaded
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+# Per worker process state, set up by _init_worker
+_worker_detector = None
+_worker_segments = {}
+
+
+def _init_worker(face_detector, emotion_backend, model_path):
+    global _worker_detector
+    from face_emotion import EmotionDetector
+    _worker_detector = EmotionDetector(face_detector=face_detector, emotion_backend=emotion_backend,
+                                       model_path=model_path)
+
+
+def _analyze_shared(segment_name, shapes, regions, reference):
+    shm = _worker_segments.get(segment_name)
+    if shm is None:
+        # Spawned workers share the parent's resource tracker, which unlinks on shutdown
+        shm = shared_memory.SharedMemory(name=segment_name)
+        _worker_segments[segment_name] = shm
+    frames = []
+    offset = 0
+    for shape in shapes:
+        frames.append(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset))
+        offset += int(np.prod(shape))
+    timings = {}
+    results = _worker_detector.analyze_frames(frames, timings, regions, reference)
+    return results, timings
+
+
+def _fit_frame(frame):
+    height, width = MAX_FRAME_SHAPE[:2]
+    if frame.shape[0] <= height and frame.shape[1] <= width:
+        return frame
+    scale = min(height / frame.shape[0], width / frame.shape[1])
+    size = (max(1, int(frame.shape[1] * scale)), max(1, int(frame.shape[0] * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+class ProcessInferencePool:
+    """Runs EmotionDetector.analyze_frames in worker processes, each holding its own models.
+
+    Frames reach the workers through a fixed set of shared memory slots instead of
+    being pickled; only boxes and probabilities travel back. Submitting blocks while
+    every slot is in flight.
+    """
+
+    def __init__(self, face_detector='haar', workers=None, max_frames=3, emotion_backend='fer', model_path=None):
+        self.face_detector = face_detector
+        self.emotion_backend = emotion_backend
+        self.model_path = model_path
+        self.workers = workers or os.cpu_count() or 1
+        self.max_frames = max_frames
+        self.executor = None
+        self.free_slots = queue.Queue()
+        self.segments = []
+        self.lock = threading.Lock()
+        self.ready_event = threading.Event()  # Set once a worker has returned a result
+
+    def _start(self):
+        # Started on first use so importing modules in spawned children stays cheap
+        with self.lock:
+            if self.executor is not None:
+                return
+            slot_bytes = self.max_frames * int(np.prod(MAX_FRAME_SHAPE))
+            for _ in range(self.workers * 2):
+                shm = shared_memory.SharedMemory(create=True, size=slot_bytes)
+                self.segments.append(shm)
+                self.free_slots.put(shm)
+            # TensorFlow is not fork-safe, so workers are spawned fresh
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.face_detector, self.emotion_backend, self.model_path),
+            )
+            logger.info(f"Started {self.workers} inference worker processes")
+
+    def submit(self, frames, regions=None, reference=None):
+        if len(frames) > self.max_frames:
+            raise ValueError(f"At most {self.max_frames} frames per call")
+        if self.executor is None:
+            self._start()
+
+        # Box coordinates do not depend on frame size, so oversized frames can simply be shrunk
+        frames = [_fit_frame(frame) for frame in frames]
+        shm = self.free_slots.get()
+        try:
+            offset = 0
+            for frame in frames:
+                np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = frame
+                offset += frame.size
+            future = self.executor.submit(_analyze_shared, shm.name, [frame.shape for frame in frames],
+                                          regions, reference)
+        except Exception:
+            self.free_slots.put(shm)
+            raise
+
+        # Workers time their stages; record them here where the metrics live
+        result = Future()
+        def _done(f):
+            self.free_slots.put(shm)
+            try:
+                results, timings = f.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            observe_stages(timings)
+            self.ready_event.set()
+            result.set_result(results)
+        future.add_done_callback(_done)
+        return result
+
+    def warm_up(self):
+        # One blank frame per worker so every process loads its models
+        blank = np.zeros(MAX_FRAME_SHAPE, dtype=np.uint8)
+        for future in [self.submit([blank]) for _ in range(self.workers)]:
+            future.result()
+
+    def ready(self):
+        return self.ready_event.is_set()
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+            for shm in self.segments:
+                shm.close()
+                shm.unlink()
+            self.segments = []
+            self.free_slots = queue.Queue()
+
+
+def create_inference_pool(backend='thread', face_detector='haar', workers=4, emotion_backend='fer', model_path=None):
+    if backend == 'process':
+        return ProcessInferencePool(face_detector=face_detector, workers=workers,
+                                    emotion_backend=emotion_backend, model_path=model_path)
+    if backend == 'thread':
+        from face_emotion import EmotionDetector
+        detector = EmotionDetector(face_detector=face_detector, emotion_backend=emotion_backend,
+                                   model_path=model_path)
+        return ThreadInferencePool(detector, workers=workers)
+    raise ValueError(f"Unknown inference backend: {backend}")
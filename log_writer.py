@@ -0,0 +1,174 @@
+import time
+import queue
+import logging
+import threading
+from collections import Counter
+import pymysql
+from database_setup import db_connection
+from metrics import EMOTION_LOG_ROWS, EMOTION_LOG_WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+# Outcomes of one write: stored, worth retrying (database unreachable), or refused for its data
+WRITTEN, RETRY, REJECTED = 'written', 'retry', 'rejected'
+MAX_RETRY_INTERVAL = 30.0  # Seconds between write attempts at most while the database is down
+
+
+class EmotionLogWriter:
+    """Streams per-frame, per-track emotion events into emotion_logs in bulk.
+
+    log() only enqueues, so the detection loop never waits on MySQL. A
+    background thread collects events and writes them with one executemany
+    (multi-row INSERT) once batch_size events are pending or flush_interval
+    seconds have passed since the oldest one. The same transaction adds the
+    batch to the per-session, per-user and global emotion count rollups. Memory is bounded by
+    max_pending: beyond that, new events (or the oldest unwritten rows while
+    the database is down) are dropped and counted. Only connection failures
+    are retried, at intervals doubling up to MAX_RETRY_INTERVAL: a batch the
+    database refuses is written row by row and the rows it still refuses are
+    dropped. close() writes everything
+    still queued before returning.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=2.0, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, name="emotion-log-writer", daemon=True)
+        self.thread.start()
+
+    def log(self, session_id, track_id, emotion, confidence, logged_at=None):
+        try:
+            self.queue.put_nowait((session_id, track_id, emotion, confidence, logged_at or time.time()))
+        except queue.Full:
+            self._drop(1)
+
+    def flush(self, timeout=10):
+        """Block until every event logged so far has been written (or given up on)."""
+        if not self.thread.is_alive():
+            return False
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+
+    def _write(self, rows):
+        session_counts = Counter((row[0], row[2]) for row in rows)
+        with db_connection() as conn:
+            if not conn:
+                return RETRY
+            started = time.perf_counter()
+            try:
+                # Log rows and rollup counts go in one transaction so they never disagree
+                conn.begin()
+                with conn.cursor() as cursor:
+                    cursor.executemany('''
+                        INSERT INTO emotion_logs (session_id, track_id, emotion, confidence, logged_at)
+                        VALUES (%s, %s, %s, %s, FROM_UNIXTIME(%s))
+                    ''', rows)
+                    cursor.executemany('''
+                        INSERT INTO session_emotion_counts (session_id, emotion, count)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+                    ''', [(session_id, emotion, n) for (session_id, emotion), n in session_counts.items()])
+                    for (session_id, emotion), n in session_counts.items():
+                        cursor.execute('''
+                            INSERT INTO user_emotion_counts (user_id, emotion, count)
+                            SELECT user_id, %s, %s FROM sessions WHERE id = %s AND user_id IS NOT NULL
+                            ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+                        ''', (emotion, n, session_id))
+                    emotion_counts = Counter()
+                    for (_, emotion), n in session_counts.items():
+                        emotion_counts[emotion] += n
+                    cursor.executemany('''
+                        INSERT INTO global_emotion_counts (emotion, count)
+                        VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+                    ''', list(emotion_counts.items()))
+                conn.commit()
+                self.written += len(rows)
+                EMOTION_LOG_ROWS.labels('written').inc(len(rows))
+                EMOTION_LOG_WRITE_SECONDS.observe(time.perf_counter() - started)
+                return WRITTEN
+            except Exception as e:
+                logger.error(f"Emotion log write failed: {e}")
+                try:
+                    conn.rollback()
+                except pymysql.MySQLError:
+                    pass
+                # Lost connections and timeouts pass; anything else fails the same way again
+                if isinstance(e, (pymysql.OperationalError, pymysql.InterfaceError)):
+                    return RETRY
+                return REJECTED
+
+    def _drop(self, count):
+        self.dropped += count
+        EMOTION_LOG_ROWS.labels('dropped').inc(count)
+
+    def _write_rows(self, rows):
+        # A rejected batch is written row by row so one bad row does not cost the others
+        for i, row in enumerate(rows):
+            result = self._write([row])
+            if result == RETRY:
+                return rows[i:]
+            if result == REJECTED:
+                logger.error(f"Dropped emotion log row the database rejected: {row}")
+                self._drop(1)
+        return []
+
+    def _flush_pending(self, pending):
+        """Write pending rows; returns the rows that must be retried later."""
+        if not pending:
+            return []
+        result = self._write(pending)
+        if result == WRITTEN:
+            return []
+        if result == REJECTED:
+            pending = self._write_rows(pending)
+        if len(pending) > self.max_pending:
+            self._drop(len(pending) - self.max_pending)
+            pending = pending[-self.max_pending:]
+        return pending
+
+    def _run(self):
+        pending = []
+        deadline = None
+        backoff = 0.0  # Delay before the next retry after a failed write, doubling while the database is down
+
+        def _flush(pending):
+            nonlocal deadline, backoff
+            pending = self._flush_pending(pending)
+            backoff = min(max(2 * backoff, self.flush_interval), MAX_RETRY_INTERVAL) if pending else 0.0
+            deadline = time.monotonic() + (backoff or self.flush_interval)
+            return pending
+
+        while True:
+            timeout = None if not pending else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush_pending(pending)
+                return
+            if isinstance(item, threading.Event):
+                pending = _flush(pending)
+                item.set()
+                continue
+            if item is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+
+            # While retrying, only the deadline triggers a write so failed attempts stay spaced out
+            if pending and ((len(pending) >= self.batch_size and not backoff) or time.monotonic() >= deadline):
+                pending = _flush(pending)
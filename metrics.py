@@ -0,0 +1,209 @@
+import bisect
+import threading
+
+# Upper bounds in seconds; the last bucket is open-ended
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PIPELINE_STAGES = ('capture', 'detect', 'classify', 'annotate', 'encode')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observing is O(log buckets) and never allocates."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+
+    def percentile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if total == 0:
+            return 0.0
+        rank = q / 100.0 * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, total_sum = self.count, self.sum
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        return {
+            "count": total,
+            "sum": total_sum,
+            "mean_ms": total_sum / total * 1000 if total else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "buckets": buckets,
+        }
+
+
+class Counter:
+    """Monotonic count, e.g. of frames or rows."""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class MetricFamily:
+    """A named metric with one Counter or Histogram per combination of label values."""
+
+    def __init__(self, name, help, kind, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()  # Exposed as 0 before the first event
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = Histogram(self.buckets) if self.kind == 'histogram' else Counter()
+                    self.children[values] = child
+        return child
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+_families = {}
+_gauges = {}  # name -> (help, labelname, callback)
+
+
+def counter(name, help, labelnames=()):
+    return _families.setdefault(name, MetricFamily(name, help, 'counter', labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _families.setdefault(name, MetricFamily(name, help, 'histogram', labelnames, buckets))
+
+
+def gauge(name, help, callback, labelname=None):
+    """Register a gauge read at scrape time.
+
+    callback returns a number, or {label value: number} when labelname is given.
+    """
+    _gauges[name] = (help, labelname, callback)
+
+
+STAGE_SECONDS = histogram('pipeline_stage_seconds', 'Duration of each detection pipeline stage', ('stage',))
+stage_latency = {stage: STAGE_SECONDS.labels(stage) for stage in PIPELINE_STAGES}
+FRAMES_CAPTURED = counter('frames_captured_total', 'Frames read from session cameras')
+FRAMES_DROPPED = counter('frames_dropped_total', 'Captured frames evicted from a full frame buffer unprocessed')
+FRAMES_PROCESSED = counter('frames_processed_total', 'Frames run through detection, by source', ('source',))
+FACES_TRACKED = counter('faces_tracked_total', 'Faces found in processed frames')
+DB_SECONDS = histogram('db_connection_seconds', 'Waiting for a pooled connection (acquire) and holding it (use)',
+                       ('phase',))
+EMOTION_LOG_ROWS = counter('emotion_log_rows_total', 'Per-face emotion log rows, by outcome', ('result',))
+EMOTION_CACHE_LOOKUPS = counter('emotion_cache_lookups_total',
+                                'Tracked faces whose emotion came from the result cache (hit) or the model (miss)',
+                                ('result',))
+EMOTION_LOG_WRITE_SECONDS = histogram('emotion_log_write_seconds', 'Duration of one bulk emotion log transaction')
+HTTP_REQUEST_SECONDS = histogram('http_request_duration_seconds', 'Request handling time until the response starts',
+                                 ('endpoint', 'method'))
+HTTP_REQUESTS = counter('http_requests_total', 'Requests by route, method and status', ('endpoint', 'method', 'status'))
+
+
+def observe_stage(stage, seconds):
+    stage_latency[stage].observe(seconds)
+
+
+def observe_stages(timings):
+    for stage, seconds in timings.items():
+        stage_latency[stage].observe(seconds)
+
+
+def stage_snapshot():
+    return {stage: histogram.snapshot() for stage, histogram in stage_latency.items()}
+
+
+def reset_stages():
+    for histogram in stage_latency.values():
+        histogram.reset()
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render_prometheus():
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for family in list(_families.values()):
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        with family.lock:
+            # Other threads add labelled children while a scrape runs
+            children = sorted(family.children.items())
+        for values, child in children:
+            if family.kind == 'counter':
+                lines.append(f"{family.name}{_labels(family.labelnames, values)} {child.value}")
+                continue
+            with child.lock:
+                counts, total, total_sum = list(child.counts), child.count, child.sum
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{family.name}_bucket{_labels(family.labelnames, values, le)} {cumulative}")
+            lines.append(f"{family.name}_sum{_labels(family.labelnames, values)} {total_sum!r}")
+            lines.append(f"{family.name}_count{_labels(family.labelnames, values)} {total}")
+    for name, (help, labelname, callback) in list(_gauges.items()):
+        try:
+            value = callback()
+        except Exception:
+            continue  # A failing gauge must not break the whole scrape
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        if labelname:
+            for label, v in sorted(value.items()):
+                lines.append(f"{name}{_labels((labelname,), (label,))} {v}")
+        else:
+            lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
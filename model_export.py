@@ -0,0 +1,142 @@
+import os
+import argparse
+import cv2
+import numpy as np
+from emotion_backends import MODEL_DIR, DEFAULT_MODEL_PATHS, packaged_model_path
+from face_emotion import EmotionDetector
+
+INPUT_SHAPE = (64, 64, 1)  # Grayscale faces, channels last like the FER Keras model
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def _frames(source):
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, name))
+                if frame is not None:
+                    yield frame
+        return
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {source}")
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def load_face_batch(source, limit=500):
+    """Detect and preprocess up to limit faces from a video file or a directory of images.
+
+    Faces are cropped exactly like the live pipeline does, so the batch can be
+    used to calibrate quantization and to compare backends.
+    """
+    detector = EmotionDetector(face_detector='haar')
+    crops = []
+    for frame in _frames(source):
+        crops.extend(detector.crop_faces(frame, detector.locate_faces(frame)))
+        if len(crops) >= limit:
+            break
+    if not crops:
+        return np.empty((0,) + INPUT_SHAPE[:2], dtype=np.float32)
+    return EmotionDetector.preprocess_faces(np.stack(crops[:limit]))
+
+
+def _load_keras_model():
+    import tensorflow as tf
+    path = packaged_model_path('emotion_model.hdf5')
+    if path is None:
+        raise FileNotFoundError("The fer package and its emotion_model.hdf5 are needed to export the model")
+    return tf.keras.models.load_model(path, compile=False)
+
+
+def export_onnx(output):
+    """Convert the FER Keras model to ONNX with a dynamic batch dimension."""
+    import tensorflow as tf
+    import tf2onnx
+    model = _load_keras_model()
+    spec = (tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=output)
+    return output
+
+
+class _CalibrationReader:
+    # Feeds calibration faces to onnxruntime.quantization.quantize_static one at a time
+    def __init__(self, input_name, batch):
+        self.input_name = input_name
+        self.faces = iter(batch[:, None, :, :, None])
+
+    def get_next(self):
+        face = next(self.faces, None)
+        return None if face is None else {self.input_name: face}
+
+
+def quantize_onnx(model_path, output, calibration=None):
+    """Quantize an ONNX model to int8.
+
+    With a calibration batch, weights and activations are quantized statically
+    (QDQ format). Without one, only the weights are, and activations are
+    quantized on the fly.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    if calibration is None or len(calibration) == 0:
+        quantize_dynamic(model_path, output, weight_type=QuantType.QInt8)
+        return output
+    input_name = ort.InferenceSession(model_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    quantize_static(model_path, output, _CalibrationReader(input_name, calibration),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+    return output
+
+
+def export_tflite(output, quantize=False, calibration=None):
+    """Convert the FER Keras model to TFLite, optionally int8-quantized.
+
+    Inputs and outputs stay float32 so the backend feeds every variant the same way.
+    """
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(_load_keras_model())
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if calibration is not None and len(calibration):
+            converter.representative_dataset = lambda: ([face[None, :, :, None]] for face in calibration)
+    with open(output, 'wb') as f:
+        f.write(converter.convert())
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the emotion classifier for the onnx and tflite backends")
+    parser.add_argument("format", choices=("onnx", "tflite"))
+    parser.add_argument("--output", help="Model file to write (default: the backend's default path)")
+    parser.add_argument("--quantize", action="store_true", help="Quantize the model to int8")
+    parser.add_argument("--calibration", help="Video file or image directory with faces for static quantization")
+    parser.add_argument("--calibration-faces", type=int, default=300)
+    args = parser.parse_args()
+
+    output = args.output or DEFAULT_MODEL_PATHS[args.format]
+    os.makedirs(os.path.dirname(os.path.abspath(output)) or MODEL_DIR, exist_ok=True)
+    calibration = load_face_batch(args.calibration, args.calibration_faces) if args.calibration else None
+    if calibration is not None:
+        print(f"Calibrating with {len(calibration)} faces from {args.calibration}")
+
+    if args.format == "onnx":
+        if args.quantize:
+            float_model = os.path.splitext(output)[0] + "_fp32.onnx"
+            export_onnx(float_model)
+            quantize_onnx(float_model, output, calibration)
+        else:
+            export_onnx(output)
+    else:
+        export_tflite(output, quantize=args.quantize, calibration=calibration)
+    print(f"Wrote {output} ({os.path.getsize(output) / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+from face_tracker import box_iou
+from metrics import EMOTION_CACHE_LOOKUPS
+
+SIGNATURE_SIZE = 16
+REUSED = 'reused'  # Signature reported for a face whose probabilities came from the cache
+
+
+def face_signatures(faces):
+    """SIGNATURE_SIZE x SIGNATURE_SIZE grayscale thumbnails (float32) of a stack of 64x64 BGR face crops."""
+    n, h, w = faces.shape[:3]
+    gray = cv2.cvtColor(faces.reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY).reshape(n, h, w)
+    cells = gray.reshape(n, SIGNATURE_SIZE, h // SIGNATURE_SIZE, SIGNATURE_SIZE, w // SIGNATURE_SIZE)
+    return cells.mean(axis=(2, 4), dtype=np.float32)
+
+
+def signature_distance(a, b):
+    """Mean absolute difference of two signatures, 0 (identical) to 1."""
+    return float(np.abs(a - b).mean()) / 255.0
+
+
+def reuse_results(boxes, signatures, reference):
+    """For each face, the cached probabilities it can reuse, or None to classify it.
+
+    reference is FaceResultCache.reference(): a face reuses the entry its box
+    overlaps most if their signatures differ by less than the threshold.
+    """
+    reused = [None] * len(boxes)
+    if reference is None or not reference[1] or not len(boxes):
+        return reused
+    threshold, entries = reference
+    overlaps = box_iou(np.array(boxes, dtype=float), np.array([box for box, _, _ in entries], dtype=float))
+    for i, signature in enumerate(signatures):
+        best = int(np.argmax(overlaps[i]))
+        if overlaps[i, best] >= 0.3 and signature_distance(signature, entries[best][1]) < threshold:
+            reused[i] = entries[best][2]
+    return reused
+
+
+class FaceResultCache:
+    """The last classification of each tracked face, reused while its crop barely changes.
+
+    Entries hold the signature of the crop that was actually classified, so
+    small changes cannot add up frame after frame without a new
+    classification; ttl seconds after it an entry expires anyway. At most
+    capacity tracks are kept, evicting the least recently seen. hits and
+    misses count the lookups, to tune threshold against accuracy.
+    """
+
+    def __init__(self, threshold=0.03, ttl=2.0, capacity=32):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.entries = OrderedDict()  # track_id -> (box, signature, probs, classified_at)
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def reference(self, now=None):
+        """What a detector needs to reuse results, (threshold, [(box, signature, probs)]); None when disabled."""
+        if self.threshold <= 0:
+            return None
+        now = time.monotonic() if now is None else now
+        return self.threshold, [(box, signature, probs) for box, signature, probs, classified_at
+                                in self.entries.values() if now - classified_at < self.ttl]
+
+    def update(self, tracks, now=None):
+        """Record one frame's classified faces: tracks maps track_id -> (box, probs, signature).
+
+        A REUSED signature means the probabilities came from this cache; a None
+        one (e.g. the classifier failed) is neither cached nor counted.
+        """
+        if self.threshold <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        for track_id, (box, probs, signature) in tracks.items():
+            if signature is None:
+                continue
+            entry = self.entries.pop(track_id, None)
+            # Compared by type: results from worker processes carry an unpickled copy of REUSED
+            if isinstance(signature, np.ndarray):
+                self.misses += 1
+                EMOTION_CACHE_LOOKUPS.labels('miss').inc()
+                self.entries[track_id] = (box, signature, probs, now)
+                continue
+            self.hits += 1
+            EMOTION_CACHE_LOOKUPS.labels('hit').inc()
+            if entry is not None:
+                self.entries[track_id] = (box,) + entry[1:]
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
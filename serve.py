@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.responses import RedirectResponse, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from app import app as flask_app, session_manager
+from client_stream import AsyncClientFrameStream
+from metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def _session_user_id(connection):
+    # Read the Flask session cookie the way Flask itself does
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookie = connection.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if serializer is None or not cookie:
+        return None
+    try:
+        data = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return data.get('user_id')
+
+
+def _record_request(endpoint, method, status, started):
+    HTTP_REQUEST_SECONDS.labels(endpoint, method).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(endpoint, method, status).inc()
+
+
+async def video_feed(request):
+    started = time.perf_counter()
+    user_id = _session_user_id(request)
+    if user_id is None:
+        _record_request('video_feed', request.method, 302, started)
+        return RedirectResponse('/login', status_code=302)
+    chunks = session_manager.get(user_id).generate_frames_async()
+    _record_request('video_feed', request.method, 200, started)
+    return StreamingResponse(chunks, media_type="multipart/x-mixed-replace; boundary=frame")
+
+
+async def stream_socket(websocket):
+    user_id = _session_user_id(websocket)
+    if user_id is None:
+        await websocket.close(code=1008)
+        return
+    await AsyncClientFrameStream(websocket, session_manager.get(user_id)).run()
+
+
+def create_app(threads=32, stream_threads=8):
+    """The Flask app behind an ASGI front end.
+
+    /video_feed and /ws/stream are coroutines, so open streams cost no
+    threads. Every other route runs in Flask on a pool of threads. JPEG
+    encoding and WebSocket inference go to a separate executor of
+    stream_threads.
+    """
+    @contextlib.asynccontextmanager
+    async def lifespan(_):
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=stream_threads, thread_name_prefix="stream"))
+        yield
+        session_manager.shutdown()
+
+    return Starlette(
+        routes=[
+            Route('/video_feed', video_feed),
+            WebSocketRoute('/ws/stream', stream_socket),
+            Mount('/', WSGIMiddleware(flask_app, workers=threads)),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app with uvicorn (one process; sessions live in memory)")
+    parser.add_argument("--host", default=os.environ.get("SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SERVER_PORT", "5000")))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("SERVER_THREADS", "32")),
+                        help="Threads running the Flask routes")
+    parser.add_argument("--stream-threads", type=int, default=int(os.environ.get("SERVER_STREAM_THREADS", "8")),
+                        help="Threads encoding MJPEG frames and analyzing WebSocket frames")
+    parser.add_argument("--backlog", type=int, default=int(os.environ.get("SERVER_BACKLOG", "2048")),
+                        help="Pending connections the socket queues")
+    parser.add_argument("--max-connections", type=int, default=int(os.environ.get("SERVER_MAX_CONNECTIONS", "0")),
+                        help="Answer 503 beyond this many open connections (0: no limit)")
+    parser.add_argument("--keep-alive", type=int, default=int(os.environ.get("SERVER_KEEP_ALIVE", "30")),
+                        help="Seconds an idle keep-alive connection stays open")
+    args = parser.parse_args()
+
+    # Sessions, their webcams and the inference pool are per process, so this is never forked into workers
+    uvicorn.run(create_app(args.threads, args.stream_threads), host=args.host, port=args.port,
+                backlog=args.backlog, limit_concurrency=args.max_connections or None,
+                timeout_keep_alive=args.keep_alive, access_log=False)
+
+
+if __name__ == "__main__":
+    main()
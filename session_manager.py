@@ -0,0 +1,71 @@
+import threading
+import logging
+from face_emotion import DetectionSession
+
+logger = logging.getLogger(__name__)
+
+
+class SessionManager:
+    """Owns one DetectionSession per logged-in user.
+
+    All sessions share one inference pool (see inference_pool) holding the
+    loaded models and a bounded set of workers, so a slow session cannot hold
+    up the others.
+    """
+
+    def __init__(self, inference, process_workers=1, detect_interval=1, log_writer=None,
+                 on_session_end=None, camera_source=0, full_scan_interval=5, result_cache_threshold=0.03,
+                 result_cache_ttl=2.0):
+        self.inference = inference
+        self.camera_source = camera_source
+        self.full_scan_interval = full_scan_interval
+        self.result_cache_threshold = result_cache_threshold
+        self.result_cache_ttl = result_cache_ttl
+        self.log_writer = log_writer
+        self.on_session_end = on_session_end
+        self.process_workers = process_workers
+        self.detect_interval = detect_interval
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            detection_session = self.sessions.get(user_id)
+            if detection_session is None:
+                detection_session = DetectionSession(
+                    self.inference, user_id,
+                    process_workers=self.process_workers,
+                    detect_interval=self.detect_interval,
+                    log_writer=self.log_writer,
+                    on_stop=self.on_session_end,
+                    camera_source=self.camera_source,
+                    full_scan_interval=self.full_scan_interval,
+                    result_cache_threshold=self.result_cache_threshold,
+                    result_cache_ttl=self.result_cache_ttl,
+                )
+                self.sessions[user_id] = detection_session
+            return detection_session
+
+    def remove(self, user_id):
+        with self.lock:
+            detection_session = self.sessions.pop(user_id, None)
+        if detection_session:
+            detection_session.stop_session()
+            logger.info(f"Released detection session for user {user_id}")
+
+    def active_count(self):
+        with self.lock:
+            return sum(1 for s in self.sessions.values() if s.is_running)
+
+    def buffered_frames(self):
+        with self.lock:
+            return sum(len(s.frame_buffer) for s in self.sessions.values() if s.is_running)
+
+    def shutdown(self):
+        with self.lock:
+            user_ids = list(self.sessions)
+        for user_id in user_ids:
+            self.remove(user_id)
+        if self.log_writer:
+            self.log_writer.close()
+        self.inference.shutdown()
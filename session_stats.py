@@ -0,0 +1,56 @@
+import time
+import numpy as np
+
+
+class SessionStats:
+    """Running emotion statistics for one detection session.
+
+    Every counter is updated incrementally from the faces visible in each
+    frame, so the cost per frame depends only on the number of faces, never
+    on how long the session has been running.
+    """
+
+    def __init__(self, labels, max_gap=1.0):
+        self.labels = list(labels)
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        self.max_gap = max_gap  # Longer pauses between frames do not count as dwell time
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.emotion_frames = np.zeros(len(self.labels), dtype=np.int64)
+        self.dwell_seconds = np.zeros(len(self.labels))
+        self.unique_faces = 0
+        self.max_track_id = -1
+        self.last_timestamp = None
+
+    def update(self, visible, timestamp=None):
+        """Count one frame of {track_id: (centroid, emotion, box)}."""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        elapsed = 0.0 if self.last_timestamp is None else min(timestamp - self.last_timestamp, self.max_gap)
+        self.last_timestamp = timestamp
+        self.frames += 1
+
+        for track_id, (_, emotion, _) in visible.items():
+            i = self.index[emotion]
+            self.emotion_frames[i] += 1
+            self.dwell_seconds[i] += elapsed
+            # Track IDs only ever increase, so anything above the max is a new face
+            if track_id > self.max_track_id:
+                self.unique_faces += 1
+        if visible:
+            self.max_track_id = max(self.max_track_id, max(visible))
+
+    def most_common_emotion(self, default='neutral'):
+        if not self.emotion_frames.any():
+            return default
+        return self.labels[int(np.argmax(self.emotion_frames))]
+
+    def summary(self):
+        return {
+            "frames": self.frames,
+            "unique_faces": self.unique_faces,
+            "most_common_emotion": self.most_common_emotion(),
+            "emotion_frames": {label: int(n) for label, n in zip(self.labels, self.emotion_frames) if n},
+            "dwell_seconds": {label: round(float(s), 2) for label, s in zip(self.labels, self.dwell_seconds) if s},
+        }
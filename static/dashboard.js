@@ -0,0 +1,68 @@
+document.addEventListener("DOMContentLoaded", function () {
+    const container = document.querySelector(".chart-container");
+    if (!container || typeof Chart === "undefined") return;
+
+    const COLORS = ["#FF6384", "#FF9F40", "#FFCD56", "#4BC0C0", "#36A2EB", "#9966FF", "#C9CBCF"];
+    const sessionId = container.dataset.sessionId;
+
+    function drawBarChart(data) {
+        new Chart(document.getElementById("bar-chart"), {
+            type: "bar",
+            data: {
+                labels: data.emotions,
+                datasets: [{ data: data.counts, backgroundColor: COLORS, borderColor: "black", borderWidth: 1 }],
+            },
+            options: {
+                plugins: {
+                    legend: { display: false },
+                    title: {
+                        display: true,
+                        text: `Emotion Distribution ${sessionId ? `(Session #${sessionId})` : "(All Sessions)"}`,
+                    },
+                },
+                scales: {
+                    x: { title: { display: true, text: "Emotions" } },
+                    y: { title: { display: true, text: "Count" }, beginAtZero: true, ticks: { precision: 0 } },
+                },
+            },
+        });
+    }
+
+    function drawPieChart(data) {
+        const total = data.counts.reduce((a, b) => a + b, 0);
+        if (total === 0) {
+            document.getElementById("pie-chart").hidden = true;
+            document.getElementById("pie-chart-empty").hidden = false;
+            return;
+        }
+        new Chart(document.getElementById("pie-chart"), {
+            type: "pie",
+            data: {
+                labels: data.emotions,
+                datasets: [{ data: data.counts, backgroundColor: COLORS }],
+            },
+            options: {
+                plugins: {
+                    title: { display: true, text: "Emotion Proportions" },
+                    tooltip: {
+                        callbacks: {
+                            label: (item) => `${item.label}: ${(100 * item.raw / total).toFixed(1)}%`,
+                        },
+                    },
+                },
+            },
+        });
+    }
+
+    const url = sessionId ? `/api/emotion_distribution?session_id=${encodeURIComponent(sessionId)}` : "/api/emotion_distribution";
+    fetch(url)
+        .then((response) => {
+            if (!response.ok) throw new Error("Failed to load emotion distribution");
+            return response.json();
+        })
+        .then((data) => {
+            drawBarChart(data);
+            drawPieChart(data);
+        })
+        .catch((error) => console.error(error));
+});
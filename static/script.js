@@ -5,9 +5,99 @@ document.addEventListener("DOMContentLoaded", function () {
     const summaryContent = document.getElementById("summary-content");
     let updateInterval;
     let stream;
+    let socket;
+    const FRAME_INTERVAL_MS = 66;  // ~15 fps upper bound for streamed frames
     let canvas = document.createElement("canvas");
-    canvas.width = 640;  // Reduced resolution
-    canvas.height = 480;
+    canvas.width = 320;  // Detector input size; server skips its own resize
+    canvas.height = 240;
+
+    function captureFrame() {
+        const ctx = canvas.getContext("2d");
+        ctx.drawImage(videoStream, 0, 0, canvas.width, canvas.height);
+        return new Promise((resolve) => canvas.toBlob(resolve, "image/jpeg", 0.85));
+    }
+
+    function openResultSocket(onOpen, onFail) {
+        // Results and summaries are pushed by the server; falls back to polling if unavailable
+        const scheme = location.protocol === "https:" ? "wss:" : "ws:";
+        const ws = new WebSocket(`${scheme}//${location.host}/ws/stream`);
+        let opened = false;
+        ws.onopen = () => {
+            opened = true;
+            onOpen();
+        };
+        ws.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            if (message.type === "result" || message.type === "summary") {
+                updateSummaryDisplay(message.summary);
+            }
+            // An error reply also ends the frame in flight
+            if ((message.type === "result" || message.type === "error") && ws.onresult) {
+                ws.onresult(message);
+            }
+        };
+        ws.onerror = () => {
+            if (!opened) onFail();
+        };
+        ws.onclose = () => {
+            // Dropped by the server or the network while the session is still active
+            if (opened && socket === ws) {
+                socket = null;
+                onFail();
+            }
+        };
+        return ws;
+    }
+
+    function startClientPolling() {
+        updateInterval = setInterval(async () => {
+            try {
+                const imageBlob = await captureFrame();
+
+                const predictResponse = await fetch("/predict_emotion", {
+                    method: "POST",
+                    headers: { "Content-Type": "image/jpeg" },
+                    body: imageBlob,
+                });
+                if (!predictResponse.ok) throw new Error("Failed to predict");
+                const summary = await predictResponse.json();
+                updateSummaryDisplay(summary);
+            } catch (error) {
+                console.error("Emotion detection failed:", error);
+            }
+        }, 2000);  // Slower update rate
+    }
+
+    function startServerPolling() {
+        updateInterval = setInterval(async () => {
+            try {
+                const summaryResponse = await fetch("/get_emotion_summary");
+                if (!summaryResponse.ok) throw new Error("Failed to fetch summary");
+                const summary = await summaryResponse.json();
+                updateSummaryDisplay(summary);
+            } catch (error) {
+                console.error("Summary update failed:", error);
+            }
+        }, 2000);
+    }
+
+    function startClientStreaming() {
+        let lastSent = 0;
+        const sendFrame = async () => {
+            if (!socket || socket.readyState !== WebSocket.OPEN) return;
+            lastSent = performance.now();
+            socket.send(await captureFrame());
+        };
+        socket = openResultSocket(sendFrame, startClientPolling);
+        socket.onresult = () => {
+            // One frame in flight: send the next as soon as its result is back, capped at the frame rate
+            setTimeout(sendFrame, Math.max(0, FRAME_INTERVAL_MS - (performance.now() - lastSent)));
+        };
+    }
+
+    function startServerStreaming() {
+        socket = openResultSocket(() => {}, startServerPolling);
+    }
 
     async function initializeServerCamera() {
         try {
@@ -56,40 +146,14 @@ document.addEventListener("DOMContentLoaded", function () {
                 if (useClientWebcam) {
                     if (await startWebcam()) {
                         stopBtn.disabled = false;
-                        updateInterval = setInterval(async () => {
-                            try {
-                                const ctx = canvas.getContext("2d");
-                                ctx.drawImage(videoStream, 0, 0, canvas.width, canvas.height);
-                                const imageData = canvas.toDataURL("image/jpeg", 0.85);  // Higher quality
-
-                                const predictResponse = await fetch("/predict_emotion", {
-                                    method: "POST",
-                                    headers: { "Content-Type": "application/json" },
-                                    body: JSON.stringify({ image: imageData }),
-                                });
-                                if (!predictResponse.ok) throw new Error("Failed to predict");
-                                const summary = await predictResponse.json();
-                                updateSummaryDisplay(summary);
-                            } catch (error) {
-                                console.error("Emotion detection failed:", error);
-                            }
-                        }, 2000);  // Slower update rate
+                        startClientStreaming();
                     } else {
                         throw new Error("Client webcam failed");
                     }
                 } else {
                     if (await initializeServerCamera()) {
                         stopBtn.disabled = false;
-                        updateInterval = setInterval(async () => {
-                            try {
-                                const summaryResponse = await fetch("/get_emotion_summary");
-                                if (!summaryResponse.ok) throw new Error("Failed to fetch summary");
-                                const summary = await summaryResponse.json();
-                                updateSummaryDisplay(summary);
-                            } catch (error) {
-                                console.error("Summary update failed:", error);
-                            }
-                        }, 2000);
+                        startServerStreaming();
                     } else {
                         throw new Error("Server camera failed");
                     }
@@ -107,6 +171,10 @@ document.addEventListener("DOMContentLoaded", function () {
     stopBtn.addEventListener("click", async function () {
         try {
             clearInterval(updateInterval);
+            if (socket) {
+                socket.close();
+                socket = null;
+            }
             if (stream) {
                 stream.getTracks().forEach(track => track.stop());
                 videoStream.srcObject = null;
@@ -133,6 +201,10 @@ document.addEventListener("DOMContentLoaded", function () {
         } else {
             html += "<li>No faces detected</li>";
         }
-        summaryContent.innerHTML = html + "</ul>";
+        html += "</ul>";
+        if (summary.session) {
+            html += `<p>Faces this session: ${summary.session.unique_faces}, mostly ${summary.session.most_common_emotion}</p>`;
+        }
+        summaryContent.innerHTML = html;
     }
 });
\ No newline at end of file